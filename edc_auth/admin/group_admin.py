@@ -1,5 +1,6 @@
 from django.contrib import admin
-from django.contrib.auth.models import Group
+from django.contrib.auth.models import Group, Permission
+from django.db.models import Prefetch
 from django.utils.html import format_html
 from django.utils.safestring import mark_safe
 from edc_model_admin.mixins import TemplatesModelAdminMixin
@@ -27,10 +28,25 @@ class GroupAdmin(TemplatesModelAdminMixin, admin.ModelAdmin):
         "permissions__codename",
     )
 
-    @staticmethod
-    def codenames(obj=None) -> str:
-        codenames = []
-        for permission in obj.permissions.all():
-            codenames.append(permission.codename)
-        codenames.sort()
-        return format_html("{}", mark_safe("<BR>".join(codenames)))  # nosec B703 B308
+    # more codenames than this are collapsed, see `codenames`
+    max_codenames = 25
+
+    def get_queryset(self, request):
+        return (
+            super()
+            .get_queryset(request)
+            .prefetch_related(
+                Prefetch("permissions", queryset=Permission.objects.order_by("codename"))
+            )
+        )
+
+    def codenames(self, obj=None) -> str:
+        codenames = [permission.codename for permission in obj.permissions.all()]
+        if len(codenames) <= self.max_codenames:
+            return format_html("{}", mark_safe("<BR>".join(codenames)))  # nosec B703 B308
+        return format_html(
+            "{}<details><summary>{} more</summary>{}</details>",
+            mark_safe("<BR>".join(codenames[: self.max_codenames])),  # nosec B703 B308
+            len(codenames) - self.max_codenames,
+            mark_safe("<BR>".join(codenames[self.max_codenames :])),  # nosec B703 B308
+        )
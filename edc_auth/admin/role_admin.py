@@ -1,6 +1,8 @@
 from typing import Tuple
 
 from django.contrib import admin
+from django.contrib.auth.models import Group
+from django.db.models import Prefetch
 from django.utils.html import format_html
 from django.utils.safestring import mark_safe
 from edc_model_admin.mixins import TemplatesModelAdminMixin
@@ -25,10 +27,14 @@ class RoleAdmin(TemplatesModelAdminMixin, admin.ModelAdmin):
 
     list_filter = ("groups__name",)
 
+    def get_queryset(self, request):
+        return (
+            super()
+            .get_queryset(request)
+            .prefetch_related(Prefetch("groups", queryset=Group.objects.order_by("name")))
+        )
+
     @staticmethod
     def group_list(obj=None) -> str:
-        group_names = []
-        for group in obj.groups.all():
-            group_names.append(group.name)
-        group_names.sort()
+        group_names = [group.name for group in obj.groups.all()]
         return format_html("{}", mark_safe("<BR>".join(group_names)))  # nosec B703 B308
@@ -1,12 +1,15 @@
 from django.contrib import admin, messages
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
-from django.contrib.auth.models import User
-from django.template.loader import render_to_string
+from django.contrib.auth.models import Group, User
+from django.contrib.sites.models import Site
+from django.db.models import Prefetch
 from edc_dashboard.utils import select_edc_template
 from edc_model_admin.mixins import TemplatesModelAdminMixin
 
 from ..admin_site import edc_auth_admin
+from ..deferred_role_updates import defer_role_group_updates
 from ..forms import UserChangeForm
+from ..models import Role
 from ..send_new_credentials_to_user import send_new_credentials_to_user
 from .list_filters import CountriesListFilter, SitesListFilter
 from .user_profile_admin import UserProfileInline
@@ -14,6 +17,14 @@ from .user_profile_admin import UserProfileInline
 admin.site.unregister(User)
 
 
+def get_template(template_name: str):
+    """Returns the template selected by `select_edc_template`.
+
+    Compiled templates are cached by Django's cached template loader.
+    """
+    return select_edc_template(template_name, "edc_auth")
+
+
 def send_new_credentials_to_user_action(modeladmin, request, queryset):  # noqa
     if request.user.has_perm("auth.change_user"):
         for obj in queryset:
@@ -76,25 +87,54 @@ class UserAdmin(TemplatesModelAdminMixin, BaseUserAdmin):
             return inline_instances
         return super().get_inline_instances(request, obj=obj)
 
+    def save_related(self, request, form, formsets, change):
+        """Updates user groups once for all role changes, see
+        `defer_role_group_updates`.
+        """
+        with defer_role_group_updates():
+            super().save_related(request, form, formsets, change)
+
+    def get_queryset(self, request):
+        """Returns the queryset with profile, roles, role groups,
+        groups and sites prefetched for the changelist columns.
+        """
+        return (
+            super()
+            .get_queryset(request)
+            .select_related("userprofile")
+            .prefetch_related(
+                Prefetch(
+                    "userprofile__roles",
+                    queryset=Role.objects.order_by("display_index", "display_name"),
+                ),
+                Prefetch(
+                    "userprofile__roles__groups", queryset=Group.objects.order_by("name")
+                ),
+                Prefetch("groups", queryset=Group.objects.order_by("name")),
+                Prefetch(
+                    "userprofile__sites",
+                    queryset=Site.objects.select_related("siteprofile").order_by(
+                        "siteprofile__country", "name"
+                    ),
+                ),
+            )
+        )
+
     @admin.display(description="Role")
     def role(self, obj=None) -> str:
-        roles = []
-        role_group_names = []
-        for role in obj.userprofile.roles.all():
-            roles.append(role)
-            role_group_names.extend([grp.name for grp in role.groups.all().order_by("name")])
-        extra_groups = [obj for obj in obj.groups.all() if obj.name not in role_group_names]
+        roles = obj.userprofile.roles.all()
+        role_group_ids = [grp.id for role in roles for grp in role.groups.all()]
+        extra_groups = [grp for grp in obj.groups.all() if grp.id not in role_group_ids]
         context = dict(
             role_names=[role.display_name for role in roles],
             extra_group_names=[grp.name.replace("_", " ") for grp in extra_groups],
         )
-        template_obj = select_edc_template("user_role_description.html", "edc_auth")
-        return render_to_string(template_obj.template.name, context)
+        return get_template("user_role_description.html").render(context)
 
     @admin.display(description="Sites")
     def sites(self, obj=None) -> str:
         country_sites = {}
-        for site in obj.userprofile.sites.all().order_by("siteprofile__country", "name"):
+        for site in obj.userprofile.sites.all():
             country_name = site.siteprofile.country.replace("_", " ").title()
             site_name = site.name.replace("_", " ").title()
             try:
@@ -103,8 +143,7 @@ class UserAdmin(TemplatesModelAdminMixin, BaseUserAdmin):
                 country_sites[country_name] = [site_name]
 
         context = dict(country_sites=country_sites)
-        template_obj = select_edc_template("user_country_sites.html", "edc_auth")
-        return render_to_string(template_obj.template.name, context)
+        return get_template("user_country_sites.html").render(context)
 
     @admin.display(
         description="Multisite", boolean=True, ordering="userprofile__is_multisite_viewer"
@@ -1,9 +1,12 @@
 from django.contrib import admin
+from django.contrib.sites.models import Site
+from django.db.models import Prefetch
 from django.utils.html import format_html
 from django.utils.safestring import mark_safe
 from edc_model_admin.mixins import TemplatesModelAdminMixin
 
 from ..admin_site import edc_auth_admin
+from ..deferred_role_updates import defer_role_group_updates
 from ..forms import UserProfileForm
 from ..models import UserProfile
 from .fieldsets import user_profile_fieldsets
@@ -41,23 +44,45 @@ class UserProfileAdmin(TemplatesModelAdminMixin, admin.ModelAdmin):
 
     search_fields = ("user__username", "mobile", "user__email")
 
+    def save_related(self, request, form, formsets, change):
+        """Updates user groups once for all role changes, see
+        `defer_role_group_updates`.
+        """
+        with defer_role_group_updates():
+            super().save_related(request, form, formsets, change)
+
+    def get_queryset(self, request):
+        notification_model_cls = UserProfile.email_notifications.field.related_model
+        return (
+            super()
+            .get_queryset(request)
+            .select_related("user")
+            .prefetch_related(
+                Prefetch("sites", queryset=Site.objects.order_by("name")),
+                Prefetch(
+                    "email_notifications",
+                    queryset=notification_model_cls.objects.order_by("display_name"),
+                ),
+                Prefetch(
+                    "sms_notifications",
+                    queryset=notification_model_cls.objects.order_by("display_name"),
+                ),
+            )
+        )
+
     @staticmethod
     def user_sites(obj=None):
-        site_names = [o.name for o in obj.sites.all().order_by("name")]
+        site_names = [o.name for o in obj.sites.all()]
         return format_html("{}", mark_safe("<BR>".join(site_names)))  # nosec B703 B308
 
     @staticmethod
     def user_email_notifications(obj=None):
-        display_names = [
-            o.display_name for o in obj.email_notifications.all().order_by("display_name")
-        ]
+        display_names = [o.display_name for o in obj.email_notifications.all()]
         return format_html("{}", mark_safe("<BR>".join(display_names)))  # nosec B703 B308
 
     @staticmethod
     def user_sms_notifications(obj=None):
-        display_names = [
-            o.display_name for o in obj.sms_notifications.all().order_by("display_name")
-        ]
+        display_names = [o.display_name for o in obj.sms_notifications.all()]
         return format_html(
             "{}",
             mark_safe("<BR>".join(display_names)),  # nosec B703, B308
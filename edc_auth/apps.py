@@ -7,6 +7,7 @@ from .system_checks import (
     check_auth_updater,
     check_etc_dir,
     check_key_path,
+    check_permissions_cache,
     check_site_auths,
     check_static_root,
 )
@@ -25,4 +26,5 @@ class AppConfig(DjangoAppConfig):
         register(check_static_root, Tags.security, deploy=True)
         register(check_site_auths)
         register(check_auth_updater)
+        register(check_permissions_cache)
         register(check_for_edc_appconfig)
@@ -0,0 +1,102 @@
+from __future__ import annotations
+
+import time
+from collections import defaultdict
+from threading import RLock
+from typing import Iterable
+
+from django.apps import apps as django_apps
+from django.conf import settings
+
+from .permissions_cache import get_permissions_version
+
+
+class AuthClosure:
+    """A process-wide cache of the role -> group -> permission closure
+    for read-only lookups, for example to display a user's codenames.
+
+    Maps role name to group ids and group id to `app_label.codename`
+    strings. Each relation is loaded with a single query.
+
+    The data is reloaded when the global permissions cache version
+    changes, see `bump_permissions_cache_version`, or is older than
+    settings.EDC_AUTH_CLOSURE_TTL seconds (default 60). The version is
+    bumped by signals on `Role.groups`, `Group.permissions`, `Role`
+    post_save and on deleting a `Group`, `Role` or `Permission`, and
+    by `AuthUpdater`.
+
+    Do not use to write, e.g. user groups, or to validate. Read
+    from the database instead.
+    """
+
+    def __init__(self):
+        self._lock = RLock()
+        self._version = None
+        self._loaded_at: float | None = None
+        self._data: dict | None = None
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}(version={self._version})"
+
+    def clear(self) -> None:
+        with self._lock:
+            self._version = None
+            self._loaded_at = None
+            self._data = None
+
+    @staticmethod
+    def get_version() -> int:
+        return get_permissions_version()
+
+    @staticmethod
+    def get_ttl() -> float:
+        return getattr(settings, "EDC_AUTH_CLOSURE_TTL", 60)
+
+    @property
+    def expired(self) -> bool:
+        return self._loaded_at is None or time.monotonic() - self._loaded_at >= self.get_ttl()
+
+    @property
+    def data(self) -> dict:
+        version = self.get_version()
+        with self._lock:
+            if self._data is None or self._version != version or self.expired:
+                self._data = self.load()
+                self._version = version
+                self._loaded_at = time.monotonic()
+            return self._data
+
+    @staticmethod
+    def load() -> dict:
+        role_model_cls = django_apps.get_model("edc_auth.role")
+        group_model_cls = django_apps.get_model("auth.group")
+        group_ids_by_role_name: dict = defaultdict(set)
+        for role_name, group_id in role_model_cls.groups.through.objects.values_list(
+            "role__name", "group_id"
+        ):
+            group_ids_by_role_name[role_name].add(group_id)
+        codenames_by_group: dict = defaultdict(set)
+        qs = group_model_cls.permissions.through.objects.values_list(
+            "group_id", "permission__content_type__app_label", "permission__codename"
+        )
+        for group_id, app_label, codename in qs:
+            codenames_by_group[group_id].add(f"{app_label}.{codename}")
+        return dict(
+            group_ids_by_role_name={
+                k: frozenset(v) for k, v in group_ids_by_role_name.items()
+            },
+            codenames_by_group={k: frozenset(v) for k, v in codenames_by_group.items()},
+        )
+
+    def get_group_ids_for_role(self, role_name: str) -> frozenset[int]:
+        return self.data["group_ids_by_role_name"].get(role_name, frozenset())
+
+    def get_codenames_for_groups(self, group_ids: Iterable[int]) -> set[str]:
+        codenames_by_group = self.data["codenames_by_group"]
+        codenames = set()
+        for group_id in group_ids:
+            codenames.update(codenames_by_group.get(group_id, frozenset()))
+        return codenames
+
+
+auth_closure = AuthClosure()
@@ -0,0 +1,113 @@
+from __future__ import annotations
+
+import json
+from pathlib import Path
+from typing import Callable
+
+from django.utils.module_loading import import_string
+
+from . import __version__
+from .site_auths import SiteAuths, get_func_path, get_registry_snapshot
+from .site_auths import site_auths as default_site_auths
+
+PLAN_FORMAT = 2
+AUTHS_MODULE_NAME = "auths"
+
+
+class AuthPlanError(Exception):
+    pass
+
+
+def get_dotted_path(func: Callable) -> str:
+    """Returns the import path of a module level function.
+
+    Functions in an `auths` module are refused. Importing one when
+    loading the plan would run the module's `site_auths`
+    registrations, the autodiscover step the plan is meant to skip.
+    """
+    path = get_func_path(func)
+    if "<" in path:
+        raise AuthPlanError(
+            f"Cannot compile update func. Expected a module level function. Got {path}."
+        )
+    if AUTHS_MODULE_NAME in path.split(".")[:-1]:
+        raise AuthPlanError(
+            "Cannot compile update func. Expected a function outside of an "
+            f"`{AUTHS_MODULE_NAME}` module. Got {path}."
+        )
+    return path
+
+
+def compile_auth_plan(site_auths: SiteAuths | None = None) -> dict:
+    """Returns the fully expanded `site_auths` registry as JSON
+    serializable data that `AuthUpdater` can apply without
+    autodiscover or calling codename callables.
+
+    Pre and post update funcs are stored as import paths.
+    """
+    site_auths = site_auths or default_site_auths
+    site_auths.verify_and_populate()
+    for func in site_auths.pre_update_funcs:
+        get_dotted_path(func)
+    for _, func in site_auths.post_update_funcs:
+        get_dotted_path(func)
+    snapshot = site_auths.snapshot(version=__version__)
+    return dict(
+        format=PLAN_FORMAT,
+        edc_auth_version=__version__,
+        hash=snapshot.hash,
+        registry=snapshot.as_dict(),
+    )
+
+
+def write_auth_plan(path: str | Path, site_auths: SiteAuths | None = None) -> dict:
+    plan = compile_auth_plan(site_auths=site_auths)
+    with Path(path).open("w") as f:
+        json.dump(plan, f, indent=2, sort_keys=True)
+    return plan
+
+
+def read_auth_plan(path: str | Path) -> dict:
+    with Path(path).open() as f:
+        return json.load(f)
+
+
+def load_auth_plan(plan: dict | str | Path) -> dict:
+    """Returns the registry data of a compiled plan, or of the
+    plan file at path `plan`, in the form used by `AuthUpdater`.
+
+    Raises `AuthPlanError` if the plan was compiled by another
+    version of edc_auth or was changed after it was compiled.
+    """
+    if not isinstance(plan, dict):
+        plan = read_auth_plan(plan)
+    if plan.get("format") != PLAN_FORMAT or plan.get("edc_auth_version") != __version__:
+        raise AuthPlanError(
+            f"Auth plan is out of date. Expected format={PLAN_FORMAT}, "
+            f"edc_auth_version={__version__}. Got format={plan.get('format')}, "
+            f"edc_auth_version={plan.get('edc_auth_version')}. Compile it again, "
+            "see management command `compile_auths`."
+        )
+    registry = plan["registry"]
+    data = dict(
+        groups=registry["groups"],
+        roles=registry["roles"],
+        pii_models=registry["pii_models"],
+        custom_permissions_tuples={
+            model: [tuple(tpl) for tpl in codename_tuples]
+            for model, codename_tuples in registry["custom_permissions_tuples"].items()
+        },
+        view_only_prefixes=registry["view_only_prefixes"],
+        pre_update_funcs=registry["pre_update_funcs"],
+        post_update_funcs=registry["post_update_funcs"],
+    )
+    if get_registry_snapshot(version=__version__, **data).hash != plan["hash"]:
+        raise AuthPlanError("Auth plan hash does not match its content.")
+    data.update(
+        pre_update_funcs=[import_string(path) for path in registry["pre_update_funcs"]],
+        post_update_funcs=[
+            (app_label, import_string(path))
+            for app_label, path in registry["post_update_funcs"]
+        ],
+    )
+    return data
@@ -5,13 +5,20 @@ from typing import Callable
 
 from django.apps import apps as django_apps
 from django.conf import settings
-from django.contrib.auth import get_user_model
 from django.core.exceptions import ObjectDoesNotExist
 from django.core.management.color import color_style
 
-from ..site_auths import site_auths
+from .. import __version__
+from ..auth_closure import auth_closure
+from ..auth_plan import load_auth_plan
+from ..deferred_role_updates import defer_role_group_updates
+from ..permissions_cache import bump_permissions_cache_version
+from ..site_auths import get_registry_snapshot, site_auths
+from .delta_planner import DeltaPlanner, print_delta
+from .fingerprints import get_database_fingerprint
 from .group_updater import GroupUpdater
 from .role_updater import RoleUpdater
+from .user_group_updater import UserGroupUpdater
 
 style = color_style()
 
@@ -19,6 +26,8 @@ style = color_style()
 class AuthUpdater:
     group_updater_cls = GroupUpdater
     role_updater_cls = RoleUpdater
+    user_group_updater_cls = UserGroupUpdater
+    delta_planner_cls = DeltaPlanner
 
     def __init__(
         self,
@@ -28,29 +37,79 @@ class AuthUpdater:
         pre_update_funcs: dict | None = None,
         post_update_funcs: list[tuple[str, Callable]] | None = None,
         custom_permissions_tuples: dict | None = None,
+        view_only_prefixes: list[str] | None = None,
         apps=None,
         verbose: bool | None = None,
         warn_only: bool | None = None,
+        force: bool | None = None,
+        plan: dict | str | None = None,
+        dry_run: bool | None = None,
     ):
-        site_auths.verify_and_populate(warn_only=warn_only)
+        """Updates groups, roles and permissions from `site_auths`.
+
+        If `plan` or settings.EDC_AUTH_PLAN_FILE is set, updates from
+        the compiled plan instead, see `compile_auths`.
+
+        The update is skipped if neither the fully expanded registry,
+        including the import paths of pre and post update funcs, nor
+        the permission, group and role tables and their through tables
+        have changed since the last completed update, see
+        `get_database_fingerprint`. Set `force=True` to update anyway.
+
+        If `dry_run`, nothing is written. The changes an update would
+        make are kept on `delta`, see `DeltaPlanner`.
+
+        Callables in `groups` are called once per run. The result is
+        kept on `registry_snapshot` and `expanded_groups` and used by
+        all later steps.
+        """
+        plan = plan or self.edc_auth_plan_file
+        if plan:
+            registry = load_auth_plan(plan)
+        else:
+            site_auths.verify_and_populate(warn_only=warn_only)
+            registry = dict(
+                groups=site_auths.groups,
+                roles=site_auths.roles,
+                pii_models=site_auths.pii_models,
+                custom_permissions_tuples=site_auths.custom_permissions_tuples,
+                view_only_prefixes=site_auths.view_only_prefixes,
+                pre_update_funcs=site_auths.pre_update_funcs,
+                post_update_funcs=site_auths.post_update_funcs,
+            )
         custom_permissions_tuples = (
-            custom_permissions_tuples or site_auths.custom_permissions_tuples
+            custom_permissions_tuples or registry["custom_permissions_tuples"]
         )
-        groups = groups or site_auths.groups
-        pii_models = pii_models or site_auths.pii_models
-        post_update_funcs = post_update_funcs or site_auths.post_update_funcs
-        pre_update_funcs = pre_update_funcs or site_auths.pre_update_funcs
-        roles = roles or site_auths.roles
+        groups = groups or registry["groups"]
+        pii_models = pii_models or registry["pii_models"]
+        post_update_funcs = post_update_funcs or registry["post_update_funcs"]
+        pre_update_funcs = pre_update_funcs or registry["pre_update_funcs"]
+        roles = roles or registry["roles"]
+        view_only_prefixes = view_only_prefixes or registry["view_only_prefixes"]
         self.apps = apps
+        self.skipped = False
+        auth_closure.clear()
         if not self.edc_auth_skip_auth_updater:
             self.verbose = verbose
             self.apps = apps
-            if self.verbose:
-                sys.stdout.write(style.MIGRATE_HEADING("Updating groups and permissions:\n"))
-            self.group_updater = self.group_updater_cls(
+            self.force = force
+            self.registry_snapshot = get_registry_snapshot(
                 groups=groups,
+                roles=roles,
+                pii_models=pii_models,
+                custom_permissions_tuples=custom_permissions_tuples,
+                view_only_prefixes=view_only_prefixes,
+                version=__version__,
+                pre_update_funcs=pre_update_funcs,
+                post_update_funcs=post_update_funcs,
+            )
+            self.expanded_groups = dict(self.registry_snapshot.groups)
+            self.registry_fingerprint = self.registry_snapshot.hash
+            self.group_updater = self.group_updater_cls(
+                groups=self.expanded_groups,
                 pii_models=pii_models,
                 custom_permissions_tuples=custom_permissions_tuples,
+                view_only_prefixes=view_only_prefixes,
                 verbose=self.verbose,
                 apps=self.apps,
                 warn_only=warn_only,
@@ -59,12 +118,33 @@ class AuthUpdater:
                 roles=roles,
                 verbose=self.verbose,
             )
-            self.run_pre_updates(pre_update_funcs)
-            self.group_updater.create_custom_permissions_from_tuples()
-            self.groups = self.group_updater.update_groups()
-            self.roles = self.role_updater.update_roles()
-            self.run_post_updates(post_update_funcs)
-            self.refresh_groups_in_roles_per_user()
+            if dry_run:
+                self.delta = self.delta_planner_cls(
+                    group_updater=self.group_updater, roles=roles, apps=self.apps
+                ).get_delta()
+                if self.verbose:
+                    print_delta(self.delta)
+                return
+            if not self.force and self.fingerprints_unchanged:
+                self.skipped = True
+                if self.verbose:
+                    sys.stdout.write(
+                        style.MIGRATE_HEADING(
+                            "Groups and permissions are up to date. Skipping.\n\n"
+                        )
+                    )
+                return
+            if self.verbose:
+                sys.stdout.write(style.MIGRATE_HEADING("Updating groups and permissions:\n"))
+            with defer_role_group_updates():
+                self.run_pre_updates(pre_update_funcs)
+                self.group_updater.create_custom_permissions_from_tuples()
+                self.groups = self.group_updater.update_groups()
+                self.roles = self.role_updater.update_roles()
+                self.run_post_updates(post_update_funcs)
+            self.refresh_groups_in_roles_per_user(apps=self.apps, verbose=self.verbose)
+            self.save_fingerprints()
+            bump_permissions_cache_version()
             if verbose:
                 sys.stdout.write(
                     style.MIGRATE_HEADING("Done updating groups and permissions.\n\n")
@@ -74,13 +154,44 @@ class AuthUpdater:
     def __repr__(self):
         return (
             f"{self.__class__.__name__}(edc_auth_skip_auth_updater="
-            f"{self.edc_auth_skip_auth_updater})"
+            f"{self.edc_auth_skip_auth_updater}, skipped={self.skipped})"
         )
 
     @property
     def edc_auth_skip_auth_updater(self):
         return getattr(settings, "EDC_AUTH_SKIP_AUTH_UPDATER", False)
 
+    @property
+    def edc_auth_plan_file(self) -> str | None:
+        return getattr(settings, "EDC_AUTH_PLAN_FILE", None)
+
+    @property
+    def fingerprint_model_cls(self):
+        return (self.apps or django_apps).get_model("edc_auth.authfingerprint")
+
+    @property
+    def fingerprints_unchanged(self) -> bool:
+        """Returns True if the registry and database fingerprints
+        match those stored by the last update.
+        """
+        try:
+            obj = self.fingerprint_model_cls.objects.get(name="default")
+        except ObjectDoesNotExist:
+            return False
+        return (
+            obj.registry_fingerprint == self.registry_fingerprint
+            and obj.database_fingerprint == get_database_fingerprint(self.apps)
+        )
+
+    def save_fingerprints(self) -> None:
+        self.fingerprint_model_cls.objects.update_or_create(
+            name="default",
+            defaults=dict(
+                registry_fingerprint=self.registry_fingerprint,
+                database_fingerprint=get_database_fingerprint(self.apps),
+            ),
+        )
+
     def run_pre_updates(self, pre_updates):
         """Custom funcs that operate after all groups and roles have been created"""
         if self.verbose:
@@ -157,14 +268,12 @@ class AuthUpdater:
                 role_obj.save()
         return role_names
 
-    @staticmethod
-    def refresh_groups_in_roles_per_user():
-        """Clear then add back roles to trigger post-save signal."""
-        for user in get_user_model().objects.all():
-            roles = [obj for obj in user.userprofile.roles.all()]
-            user.userprofile.roles.clear()
-            user.groups.clear()
-            for role in roles:
-                user.userprofile.roles.add(role)
-            user.userprofile.save()
-            user.save()
+    @classmethod
+    def refresh_groups_in_roles_per_user(
+        cls, apps=None, verbose: bool | None = None
+    ) -> dict[int, tuple[int, int]]:
+        """Syncs each user's groups with the groups of the user's roles.
+
+        See `UserGroupUpdater`.
+        """
+        return cls.user_group_updater_cls(apps=apps, verbose=verbose).update_user_groups()
@@ -0,0 +1,328 @@
+from __future__ import annotations
+
+import sys
+from collections import defaultdict
+from typing import TYPE_CHECKING, Any
+
+from django.apps import apps as django_apps
+from django.contrib.auth import get_user_model
+from django.core.management.color import color_style
+
+from ..constants import CUSTOM_ROLE
+from ..site_auths import expand_codenames
+from .group_updater import PermissionsCodenameError
+
+if TYPE_CHECKING:
+    from .group_updater import GroupUpdater
+
+style = color_style()
+
+
+class DeltaPlanner:
+    """Calculates what `AuthUpdater` would change in the database
+    without writing anything.
+
+    Current permissions, groups, roles and user groups are read in a
+    few bulk queries and compared in memory to the expected state,
+    the same target `GroupUpdater.update_group` writes. Pre and post
+    update funcs are not run.
+
+    Usage:
+        delta = DeltaPlanner(group_updater=group_updater, roles=roles).get_delta()
+    """
+
+    def __init__(self, group_updater: GroupUpdater = None, roles: dict = None, apps=None):
+        self.group_updater = group_updater
+        self.roles = roles or {}
+        self.apps = apps or django_apps
+        self.group_model_cls = self.apps.get_model("auth.group")
+        self.role_model_cls = self.apps.get_model("edc_auth.role")
+        self.user_profile_model_cls = self.apps.get_model("edc_auth.userprofile")
+        self.user_model_cls = get_user_model()
+        # {"app_label.codename": content type id} of permissions to be created
+        self.new_permissions: dict[str, int | None] = {}
+        # labels of models without a content type
+        self.missing_content_types: set[str] = set()
+        self.missing_codenames: set[str] = set()
+        self.expected_groups_by_role: dict[str, set] = {}
+        self.cascade_deletes = 0
+
+    def get_delta(self) -> dict:
+        """Returns a dict of the changes `AuthUpdater` would make.
+
+        * content_types: {"create": n}
+        * permissions: {"create": n, "update": n}
+        * groups: {"create": [names], "delete": [names]}
+        * group_permissions: {group name: (added, removed)}
+        * roles: {"create": [names], "update": [names]}
+        * role_groups: {role name: (added, removed)}
+        * user_groups: {user_id: (added, removed)}
+        * cascade_deletes: rows deleted with the deleted groups
+        * estimated_writes: rows inserted, updated or deleted
+
+        Only groups, roles and users with changes are included.
+
+        Content types are read, not created, see
+        `GroupUpdater.get_content_types`.
+        """
+        self.cascade_deletes = 0
+        delta: dict[str, Any] = dict(permissions=self.plan_permissions())
+        delta.update(self.plan_groups())
+        delta.update(content_types=dict(create=len(self.missing_content_types)))
+        delta.update(self.plan_roles(deleted_groups=set(delta["groups"]["delete"])))
+        delta.update(self.plan_user_groups(deleted_groups=set(delta["groups"]["delete"])))
+        delta.update(
+            cascade_deletes=self.cascade_deletes,
+            missing_codenames=sorted(self.missing_codenames),
+            invalid_role_groups={
+                role_name: sorted(set(group_names) - set(self.group_updater.group_names))
+                for role_name, group_names in self.roles.items()
+                if set(group_names) - set(self.group_updater.group_names)
+            },
+        )
+        delta.update(estimated_writes=self.get_estimated_writes(delta))
+        return delta
+
+    @staticmethod
+    def get_estimated_writes(delta: dict) -> int:
+        return (
+            delta["content_types"]["create"]
+            + sum(delta["permissions"].values())
+            + len(delta["groups"]["create"])
+            + len(delta["groups"]["delete"])
+            + len(delta["roles"]["create"])
+            + len(delta["roles"]["update"])
+            + delta["cascade_deletes"]
+            + sum(
+                added + removed
+                for key in ["group_permissions", "role_groups", "user_groups"]
+                for added, removed in delta[key].values()
+            )
+        )
+
+    def plan_permissions(self) -> dict[str, int]:
+        """Returns the number of custom permissions to create and to
+        update, see `GroupUpdater.bulk_create_permissions_from_tuples`.
+
+        Permissions of models without a content type are counted as
+        to create.
+        """
+        names = self.group_updater.get_custom_permission_names_by_model(
+            self.group_updater.custom_permissions_tuples
+        )
+        content_types = self.group_updater.get_content_types(
+            {model_cls for model_cls, _ in names}, create_content_types=False
+        )
+        qs = self.group_updater.permission_model_cls.objects.filter(
+            content_type__in=content_types.values(),
+            codename__in={codename for _, codename in names},
+        )
+        existing = {
+            (content_type_id, codename): name
+            for content_type_id, codename, name in qs.values_list(
+                "content_type_id", "codename", "name"
+            )
+        }
+        update = 0
+        for (model_cls, codename), name in names.items():
+            content_type = content_types.get(model_cls)
+            if content_type is None:
+                self.missing_content_types.add(model_cls._meta.label_lower)
+                self.new_permissions[f"{model_cls._meta.app_label}.{codename}"] = None
+                continue
+            try:
+                existing_name = existing[(content_type.id, codename)]
+            except KeyError:
+                self.new_permissions[f"{content_type.app_label}.{codename}"] = content_type.id
+            else:
+                if existing_name != name:
+                    update += 1
+        return dict(create=len(self.new_permissions), update=update)
+
+    def get_expected_permissions(self, codenames, exclude_content_type_ids: set) -> set:
+        """Returns a set of permission ids, or dotted codenames for
+        permissions not yet created, expected for a group.
+        """
+        expected = set()
+        for dotted_codename in expand_codenames(codenames):
+            try:
+                app_label, codename = self.group_updater.get_from_dotted_codename(
+                    dotted_codename
+                )
+            except PermissionsCodenameError:
+                self.missing_codenames.add(dotted_codename)
+                continue
+            if self.group_updater.is_view_only_restricted(codename):
+                continue
+            permissions = self.group_updater.permission_index.get(app_label, codename)
+            if permissions:
+                expected.update(
+                    obj.id
+                    for obj in permissions
+                    if obj.content_type_id not in exclude_content_type_ids
+                )
+            elif dotted_codename in self.new_permissions:
+                if self.new_permissions[dotted_codename] not in exclude_content_type_ids:
+                    expected.add(dotted_codename)
+            else:
+                self.missing_codenames.add(dotted_codename)
+        return expected
+
+    def plan_groups(self) -> dict:
+        """Returns the groups to create and delete and the permission
+        rows to add and remove per group.
+        """
+        group_ids = dict(self.group_model_cls.objects.values_list("name", "id"))
+        current: dict[int, set] = defaultdict(set)
+        qs = self.group_model_cls.permissions.through.objects.values_list(
+            "group_id", "permission_id"
+        )
+        for group_id, permission_id in qs:
+            current[group_id].add(permission_id)
+        pii_model_classes = self.group_updater.get_pii_model_classes()
+        pii_content_types = self.group_updater.get_content_types(
+            pii_model_classes, create_content_types=False
+        )
+        self.missing_content_types.update(
+            model_cls._meta.label_lower
+            for model_cls in pii_model_classes
+            if model_cls not in pii_content_types
+        )
+        group_permissions = {}
+        for group_name, codenames in self.group_updater.groups.items():
+            expected = self.get_expected_permissions(
+                codenames,
+                self.group_updater.get_excluded_content_type_ids(
+                    group_name, create_content_types=False
+                ),
+            )
+            current_ids = current[group_ids.get(group_name)]
+            changes = (len(expected - current_ids), len(current_ids - expected))
+            if any(changes):
+                group_permissions[group_name] = changes
+        delete = sorted(set(group_ids) - set(self.group_updater.group_names))
+        self.cascade_deletes += sum(len(current[group_ids[name]]) for name in delete)
+        return dict(
+            groups=dict(
+                create=sorted(set(self.group_updater.group_names) - set(group_ids)),
+                delete=delete,
+            ),
+            group_permissions=group_permissions,
+        )
+
+    def plan_roles(self, deleted_groups: set[str]) -> dict:
+        """Returns the roles to create and update and the group links
+        to add and remove per role, see `RoleUpdater`.
+        """
+        existing = {
+            name: (display_name, display_index)
+            for name, display_name, display_index in self.role_model_cls.objects.values_list(
+                "name", "display_name", "display_index"
+            )
+        }
+        create, update = [], []
+        for index, role_name in enumerate(self.roles):
+            display_name = role_name.replace("_", " ").lower().title()
+            if role_name not in existing:
+                create.append(role_name)
+            elif existing[role_name] != (display_name, index):
+                update.append(role_name)
+        current: dict[str, set] = defaultdict(set)
+        for role_name, group_name in self.role_model_cls.groups.through.objects.values_list(
+            "role__name", "group__name"
+        ):
+            current[role_name].add(group_name)
+        role_groups = {}
+        for role_name, group_names in self.roles.items():
+            current_names = current[role_name] - deleted_groups
+            changes = (
+                len(set(group_names) - current_names),
+                len(current_names - set(group_names)),
+            )
+            if any(changes):
+                role_groups[role_name] = changes
+        self.expected_groups_by_role = {
+            role_name: group_names - deleted_groups
+            for role_name, group_names in current.items()
+        }
+        self.expected_groups_by_role.update(
+            {role_name: set(group_names) for role_name, group_names in self.roles.items()}
+        )
+        self.cascade_deletes += sum(
+            len(group_names & deleted_groups) for group_names in current.values()
+        )
+        return dict(roles=dict(create=create, update=update), role_groups=role_groups)
+
+    def plan_user_groups(self, deleted_groups: set[str]) -> dict:
+        """Returns the group rows to add and remove per user after
+        roles are updated, see `UserGroupUpdater`.
+
+        Call after `plan_roles`.
+        """
+        role_names_by_user: dict[int, set] = defaultdict(set)
+        for (
+            user_id,
+            role_name,
+        ) in self.user_profile_model_cls.roles.through.objects.values_list(
+            "userprofile__user_id", "role__name"
+        ):
+            role_names_by_user[user_id].add(role_name)
+        current: dict[int, set] = defaultdict(set)
+        for user_id, group_name in self.user_model_cls.groups.through.objects.values_list(
+            "user_id", "group__name"
+        ):
+            current[user_id].add(group_name)
+        user_groups = {}
+        for user_id in self.user_model_cls.objects.values_list("id", flat=True):
+            if CUSTOM_ROLE in role_names_by_user[user_id]:
+                continue
+            expected = set().union(
+                *[
+                    self.expected_groups_by_role.get(role_name, set())
+                    for role_name in role_names_by_user[user_id]
+                ]
+            )
+            current_names = current[user_id] - deleted_groups
+            changes = (len(expected - current_names), len(current_names - expected))
+            if any(changes):
+                user_groups[user_id] = changes
+        self.cascade_deletes += sum(
+            len(group_names & deleted_groups) for group_names in current.values()
+        )
+        return dict(user_groups=user_groups)
+
+
+def print_delta(delta: dict) -> None:
+    """Writes the delta from `DeltaPlanner.get_delta` to stdout."""
+    sys.stdout.write(style.MIGRATE_HEADING("Dry run. Planned changes:\n"))
+    sys.stdout.write(f" - Content types: create {delta['content_types']['create']}\n")
+    sys.stdout.write(
+        f" - Permissions: create {delta['permissions']['create']}, "
+        f"update {delta['permissions']['update']}\n"
+    )
+    for key, title in [("groups", "Groups"), ("roles", "Roles")]:
+        sys.stdout.write(f" - {title}:\n")
+        for action, names in delta[key].items():
+            sys.stdout.write(f"   * {action} {len(names)}: {', '.join(names) or '-'}\n")
+    for key, title in [
+        ("group_permissions", "Group permissions"),
+        ("role_groups", "Role groups"),
+    ]:
+        sys.stdout.write(f" - {title}:\n")
+        for name, (added, removed) in sorted(delta[key].items()):
+            sys.stdout.write(f"   * {name.lower()} (+{added}, -{removed})\n")
+        if not delta[key]:
+            sys.stdout.write("   * nothing to do\n")
+    added = sum(added for added, _ in delta["user_groups"].values())
+    removed = sum(removed for _, removed in delta["user_groups"].values())
+    sys.stdout.write(
+        f" - User groups:\n   * {len(delta['user_groups'])} users (+{added}, -{removed})\n"
+    )
+    if delta["missing_codenames"]:
+        sys.stdout.write(f" - Missing codenames: {', '.join(delta['missing_codenames'])}\n")
+    for role_name, group_names in delta["invalid_role_groups"].items():
+        sys.stdout.write(f" - Invalid groups for role {role_name}: {', '.join(group_names)}\n")
+    sys.stdout.write(
+        f"Cascade deletes: {delta['cascade_deletes']}. "
+        f"Estimated row writes: {delta['estimated_writes']}.\n\n"
+    )
@@ -0,0 +1,41 @@
+from __future__ import annotations
+
+import json
+from hashlib import sha256
+
+from django.apps import apps as django_apps
+from django.contrib.auth import get_user_model
+
+
+def get_database_fingerprint(apps=None) -> str:
+    """Returns a hash of the rows `AuthUpdater` writes or reads.
+
+    Includes the permission, group and role tables and the
+    group/permission, role/group, user/role and user/group
+    through tables, so changes made outside of `AuthUpdater`,
+    e.g. in the admin, are detected.
+    """
+    apps = apps or django_apps
+    group_model_cls = apps.get_model("auth.group")
+    role_model_cls = apps.get_model("edc_auth.role")
+    querysets = [
+        apps.get_model("auth.permission").objects.values_list(
+            "id", "content_type__app_label", "content_type__model", "codename"
+        ),
+        group_model_cls.objects.values_list("id", "name"),
+        role_model_cls.objects.values_list("id", "name", "display_name", "display_index"),
+        group_model_cls.permissions.through.objects.values_list(
+            "id", "group_id", "permission_id"
+        ),
+        role_model_cls.groups.through.objects.values_list("id", "role_id", "group_id"),
+        apps.get_model("edc_auth.userprofile").roles.through.objects.values_list(
+            "id", "userprofile_id", "role_id"
+        ),
+        get_user_model().groups.through.objects.values_list("id", "user_id", "group_id"),
+    ]
+    fingerprint = sha256()
+    for qs in querysets:
+        fingerprint.update(qs.model._meta.label_lower.encode())
+        for row in qs.order_by("id").iterator(chunk_size=2000):
+            fingerprint.update(json.dumps(row).encode())
+    return fingerprint.hexdigest()
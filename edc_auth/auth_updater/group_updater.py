@@ -1,3 +1,5 @@
+from __future__ import annotations
+
 import sys
 from typing import Any, List, Optional
 from warnings import warn
@@ -10,9 +12,12 @@ from django.core.exceptions import (
     ValidationError,
 )
 from django.core.management.color import color_style
+from django.db.models import Count, Q
 
 from ..auth_objects import PII, PII_VIEW
+from ..site_auths import expand_codenames
 from ..utils import make_view_only_group_permissions
+from .permission_index import PermissionIndex
 
 style = color_style()
 
@@ -33,6 +38,9 @@ class CodenameDoesNotExist(Exception):
 
 class GroupUpdater:
     default_model_name = "edcpermissions"
+    # see `remove_historical_group_permissions` and `make_view_only_group_permissions`.
+    # Add more with `site_auths.add_view_only_prefix`.
+    view_only_prefixes = ["_historical", "site"]
 
     def __init__(
         self,
@@ -43,6 +51,7 @@ class GroupUpdater:
         custom_permissions_tuples: Optional[dict] = None,
         warn_only=None,
         codename_prefixes: Optional[list] = None,
+        view_only_prefixes: Optional[list] = None,
     ):
         self.apps = apps or django_apps
         self.content_type_model_cls = self.apps.get_model("contenttypes.contenttype")
@@ -51,7 +60,17 @@ class GroupUpdater:
         self.group_names = list(groups.keys())
         self.groups = groups
         self.permission_model_cls = self.apps.get_model("auth.permission")
+        self.permission_index = PermissionIndex(self.permission_model_cls)
         self.pii_models = pii_models or []
+        self.permission_changes: dict[str, tuple[int, int]] = {}
+        self.pii_permission_changes: dict[str, int] = {}
+        self.pii_content_type_ids: set[int] | None = None
+        self.view_only_prefixes = self.view_only_prefixes + [
+            prefix
+            for prefix in view_only_prefixes or []
+            if prefix not in self.view_only_prefixes
+        ]
+        self.view_only_changes: int = 0
         self.verbose = verbose
         self.warn_only = getattr(settings, "EDC_AUTH_CODENAMES_WARN_ONLY", warn_only)
 
@@ -72,34 +91,131 @@ class GroupUpdater:
     def update_groups(self):
         if self.verbose:
             sys.stdout.write(style.MIGRATE_HEADING(" - Updating groups:\n"))
+        self.permission_changes = {}
         for group_name, codenames in self.groups.items():
-            self.update_group(group_name, codenames, create_group=True)
-        for group in self.group_model_cls.objects.exclude(name__in=[PII, PII_VIEW]):
-            self.remove_pii_permissions_from_group(group)
+            self.permission_changes[group_name] = self.update_group(
+                group_name, codenames, create_group=True
+            )
+        self.view_only_changes = self.remove_view_only_restricted_permissions()
+        self.pii_permission_changes = self.remove_pii_permissions()
         self.group_model_cls.objects.exclude(name__in=self.group_names).delete()
         if self.verbose:
             sys.stdout.write("   Done.\n")
 
-    def update_group(self, group_name, codenames, create_group=None):
-        if self.verbose:
-            sys.stdout.write(f"   * {group_name.lower()}\n")
+    def update_group(self, group_name, codenames, create_group=None) -> tuple[int, int]:
+        """Updates the permissions for the group to match the codenames.
+
+        Only the difference between the current and expected permissions
+        is written. Permissions for `pii_models` are not expected unless
+        the group is PII or PII_VIEW. Returns a tuple of the number of
+        permission rows added and removed.
+        """
         try:
             group = self.group_model_cls.objects.get(name=group_name)
         except ObjectDoesNotExist as e:
             if not create_group:
                 raise ObjectDoesNotExist(f"{e} Got {group_name}")
             group = self.group_model_cls.objects.create(name=group_name)
-        else:
-            group.permissions.clear()
-        self.add_permissions_to_group_by_codenames(group, codenames)
-        self.remove_historical_group_permissions(group)
-        make_view_only_group_permissions("site", group)
+        permission_ids = set()
+        if codenames:
+            exclude_content_type_ids = self.get_excluded_content_type_ids(group_name)
+            permission_ids = {
+                permission.id
+                for permission in self.get_permissions_qs_from_codenames(codenames)
+                if not self.is_view_only_restricted(permission.codename)
+                and permission.content_type_id not in exclude_content_type_ids
+            }
+        added, removed = self.update_group_permissions(group, permission_ids)
+        if self.verbose:
+            sys.stdout.write(f"   * {group_name.lower()} (+{added}, -{removed})\n")
+        return added, removed
+
+    def get_excluded_content_type_ids(
+        self, group_name: str, create_content_types: bool | None = None
+    ) -> set[int]:
+        """Returns the content type ids of `pii_models` unless the
+        group is PII or PII_VIEW.
+
+        See `get_content_types` for `create_content_types`.
+        """
+        if group_name in [PII, PII_VIEW]:
+            return set()
+        if self.pii_content_type_ids is None:
+            self.pii_content_type_ids = {
+                obj.id
+                for obj in self.get_pii_content_types(
+                    create_content_types=create_content_types
+                )
+            }
+        return self.pii_content_type_ids
+
+    def update_group_permissions(self, group, permission_ids: set[int]) -> tuple[int, int]:
+        """Adds and removes rows on the group/permission through model
+        so that the group has exactly `permission_ids`.
+        """
+        through_model_cls = self.group_model_cls.permissions.through
+        current_ids = set(
+            through_model_cls.objects.filter(group=group).values_list(
+                "permission_id", flat=True
+            )
+        )
+        add_ids = permission_ids - current_ids
+        remove_ids = current_ids - permission_ids
+        if remove_ids:
+            through_model_cls.objects.filter(
+                group=group, permission_id__in=remove_ids
+            ).delete()
+        if add_ids:
+            through_model_cls.objects.bulk_create(
+                [through_model_cls(group=group, permission_id=pk) for pk in add_ids]
+            )
+        return len(add_ids), len(remove_ids)
+
+    def is_view_only_restricted(self, codename: str) -> bool:
+        """Returns True if the codename would be removed by
+        `make_view_only_group_permissions` for one of the
+        `view_only_prefixes`.
+        """
+        for prefix in self.view_only_prefixes:
+            if f"_{prefix}" in codename and not codename.startswith(f"view_{prefix}"):
+                return True
+        return False
+
+    def get_view_only_restricted_q(self) -> Q:
+        """Returns a Q on the group/permission through model matching
+        permissions restricted by the `view_only_prefixes`.
+        """
+        q = Q()
+        for prefix in self.view_only_prefixes:
+            q |= Q(permission__codename__contains=f"_{prefix}") & ~Q(
+                permission__codename__startswith=f"view_{prefix}"
+            )
+        return q
+
+    def remove_view_only_restricted_permissions(self) -> int:
+        """Removes permissions restricted by the `view_only_prefixes`
+        from all groups in this update in a single delete statement.
+
+        Restricted permissions are already excluded in `update_group`,
+        so this normally deletes nothing and nothing is written.
+        """
+        if not self.view_only_prefixes:
+            return 0
+        through_model_cls = self.group_model_cls.permissions.through
+        qs = through_model_cls.objects.filter(group__name__in=self.group_names).filter(
+            self.get_view_only_restricted_q()
+        )
+        if not qs.exists():
+            return 0
+        deleted, _ = qs.delete()
+        if deleted and self.verbose:
+            sys.stdout.write(f"   * removed {deleted} view-only restricted permissions\n")
+        return deleted
 
     def add_permissions_to_group_by_codenames(self, group=None, codenames=None):
         if codenames:
             permissions = self.get_permissions_qs_from_codenames(codenames)
-            for permission in permissions:
-                group.permissions.add(permission)
+            group.permissions.add(*permissions)
 
     def get_permissions_qs_from_codenames(
         self, codenames: List[Any], allow_multiple_objects: Optional[bool] = None
@@ -110,44 +226,57 @@ class GroupUpdater:
         codenames:  a list of codenames or a list of functions that
                       returns a list. Combining codenames and funcs
                       in a list also works.
+
+        Permissions are read from the `permission_index`.
         """
         permissions = []
-        expanded_codenames = []
-        for item in codenames:
-            try:
-                expanded_codenames.extend(item())
-            except TypeError:
-                expanded_codenames.append(item)
-        for dotted_codename in expanded_codenames:
+        for dotted_codename in expand_codenames(codenames):
             try:
                 app_label, codename = self.get_from_dotted_codename(dotted_codename)
             except PermissionsCodenameError as e:
                 warn(str(e))
             else:
-                try:
-                    permissions.append(
-                        self.permission_model_cls.objects.get(
-                            codename=codename, content_type__app_label=app_label
-                        )
-                    )
-                except ObjectDoesNotExist as e:
-                    errmsg = f"{e} Got codename={codename},app_label={app_label}"
-                    if not self.warn_only:
-                        raise CodenameDoesNotExist(errmsg)
-                    warn(style.ERROR(errmsg))
-                except MultipleObjectsReturned as e:
-                    if not allow_multiple_objects:
-                        self.delete_and_raise_on_duplicate_codenames(
-                            codename, app_label, exception=e
-                        )
-                    permissions.extend(
-                        [
-                            obj
-                            for obj in self.permission_model_cls.objects.filter(
-                                codename=codename, content_type__app_label=app_label
-                            )
-                        ]
+                permissions.extend(
+                    self.get_permissions_for_codename(
+                        app_label, codename, allow_multiple_objects=allow_multiple_objects
                     )
+                )
+        return permissions
+
+    def get_permissions_for_codename(
+        self, app_label: str, codename: str, allow_multiple_objects: Optional[bool] = None
+    ) -> list:
+        """Returns a list of permissions for the app_label and codename.
+
+        Falls back to the DB if the codename is not in the index in case
+        the permission was created after the index was loaded.
+        """
+        permissions = self.permission_index.get(app_label, codename)
+        if not permissions:
+            permissions = [
+                obj
+                for obj in self.permission_model_cls.objects.filter(
+                    codename=codename, content_type__app_label=app_label
+                )
+            ]
+        if not permissions:
+            errmsg = (
+                f"{self.permission_model_cls._meta.object_name} matching query does not "
+                f"exist. Got codename={codename},app_label={app_label}"
+            )
+            if not self.warn_only:
+                raise CodenameDoesNotExist(errmsg)
+            warn(style.ERROR(errmsg))
+        elif len(permissions) > 1 and not allow_multiple_objects:
+            self.delete_and_raise_on_duplicate_codenames(
+                codename,
+                app_label,
+                exception=MultipleObjectsReturned(
+                    f"get() returned more than one "
+                    f"{self.permission_model_cls._meta.object_name} -- "
+                    f"it returned {len(permissions)}!"
+                ),
+            )
         return permissions
 
     def get_from_dotted_codename(self, codename=None):
@@ -178,9 +307,86 @@ class GroupUpdater:
             )
         return app_label, _codename
 
-    def remove_pii_permissions_from_group(self, group):
+    def remove_pii_permissions(self, groups=None) -> dict[str, int]:
+        """Removes permissions for `pii_models` from groups in a single
+        delete statement on the group/permission through model.
+
+        `update_group` does not add these, so this normally deletes
+        nothing for groups in this update.
+
+        Default is all groups except PII and PII_VIEW.
+
+        Returns a dict of {group name: number of rows removed}.
+        """
+        content_types = self.get_pii_content_types()
+        if not content_types:
+            return {}
+        through_model_cls = self.group_model_cls.permissions.through
+        qs = through_model_cls.objects.filter(permission__content_type__in=content_types)
+        if groups is None:
+            qs = qs.exclude(group__name__in=[PII, PII_VIEW])
+        else:
+            qs = qs.filter(group__in=groups)
+        removed = dict(qs.values_list("group__name").annotate(count=Count("id")).order_by())
+        if removed:
+            qs.delete()
+            if self.verbose:
+                for group_name, count in sorted(removed.items()):
+                    sys.stdout.write(f"   * {group_name.lower()} (-{count} PII)\n")
+        return removed
+
+    def get_pii_model_classes(self) -> list:
+        """Returns a list of model classes for `pii_models`."""
+        model_classes = []
         for model in self.pii_models:
-            self.remove_permissions_by_model(group, model)
+            try:
+                model_classes.append(self.apps.get_model(model))
+            except LookupError as e:
+                warn(f"Unable to remove permissions. {e}. Got {model}")
+        return model_classes
+
+    def get_pii_content_types(self, create_content_types: bool | None = None) -> list:
+        """Returns a list of content types for `pii_models`.
+
+        See `get_content_types` for `create_content_types`.
+        """
+        return list(
+            self.get_content_types(
+                self.get_pii_model_classes(), create_content_types=create_content_types
+            ).values()
+        )
+
+    def get_content_types(
+        self, model_classes, create_content_types: bool | None = None
+    ) -> dict:
+        """Returns a dict of {model_cls: content type}.
+
+        Missing content types are created unless
+        `create_content_types` is False. If False, content types are
+        read in one query and missing ones are left out.
+        """
+        if not model_classes:
+            return {}
+        if create_content_types is None or create_content_types:
+            return self.content_type_model_cls.objects.get_for_models(*model_classes)
+        keys = {}
+        q = Q()
+        for model_cls in model_classes:
+            opts = model_cls._meta.concrete_model._meta
+            keys[model_cls] = (opts.app_label, opts.model_name)
+            q |= Q(app_label=opts.app_label, model=opts.model_name)
+        content_types = {
+            (obj.app_label, obj.model): obj
+            for obj in self.content_type_model_cls.objects.filter(q)
+        }
+        return {
+            model_cls: content_types[key]
+            for model_cls, key in keys.items()
+            if key in content_types
+        }
+
+    def remove_pii_permissions_from_group(self, group) -> int:
+        return self.remove_pii_permissions(groups=[group]).get(group.name, 0)
 
     @staticmethod
     def remove_historical_group_permissions(group=None, model=None):
@@ -202,32 +408,95 @@ class GroupUpdater:
             ):
                 group.permissions.remove(permission)
 
-    def create_custom_permissions_from_tuples(self):
-        for model, codename_tuples in self.custom_permissions_tuples.items():
-            self.create_permissions_from_tuples(model, codename_tuples)
+    def create_custom_permissions_from_tuples(self) -> tuple[int, int]:
+        return self.bulk_create_permissions_from_tuples(self.custom_permissions_tuples)
 
     def create_permissions_from_tuples(self, model=None, codename_tuples=None):
         """Creates custom permissions on model `model`."""
         if codename_tuples:
+            self.bulk_create_permissions_from_tuples({model: codename_tuples})
+
+    def bulk_create_permissions_from_tuples(
+        self, custom_permissions_tuples: dict | None
+    ) -> tuple[int, int]:
+        """Creates custom permissions for all models in
+        `custom_permissions_tuples`, {model: [(codename, name), ...]}.
+
+        Content types and existing permissions are read in one
+        query each. Missing permissions are created and permissions
+        with a changed name are updated.
+
+        Returns a tuple of the number of permissions created and
+        updated.
+        """
+        names = self.get_custom_permission_names(custom_permissions_tuples)
+        if not names:
+            return 0, 0
+        existing = {
+            (obj.content_type, obj.codename): obj
+            for obj in self.permission_model_cls.objects.select_related("content_type").filter(
+                content_type__in={content_type for content_type, _ in names},
+                codename__in={codename for _, codename in names},
+            )
+        }
+        create_permissions = []
+        update_permissions = []
+        for (content_type, codename), name in names.items():
             try:
-                model_cls = self.apps.get_model(model)
-            except LookupError as e:
-                warn(f"{e}. Got {model}")
+                permission = existing[(content_type, codename)]
+            except KeyError:
+                create_permissions.append(
+                    self.permission_model_cls(
+                        name=name, codename=codename, content_type=content_type
+                    )
+                )
             else:
-                content_type = self.content_type_model_cls.objects.get_for_model(model_cls)
+                if permission.name != name:
+                    permission.name = name
+                    update_permissions.append(permission)
+        if create_permissions:
+            self.permission_model_cls.objects.bulk_create(create_permissions)
+            self.permission_index.reset()
+        if update_permissions:
+            self.permission_model_cls.objects.bulk_update(update_permissions, ["name"])
+        return len(create_permissions), len(update_permissions)
+
+    def get_custom_permission_names(
+        self, custom_permissions_tuples: dict | None
+    ) -> dict[tuple[Any, str], str]:
+        """Returns a dict of {(content_type, codename): name} from
+        `custom_permissions_tuples` after validating each codename.
+
+        Missing content types are created.
+        """
+        names_by_model = self.get_custom_permission_names_by_model(custom_permissions_tuples)
+        content_types = self.get_content_types({model_cls for model_cls, _ in names_by_model})
+        return {
+            (content_types[model_cls], codename): name
+            for (model_cls, codename), name in names_by_model.items()
+        }
+
+    def get_custom_permission_names_by_model(
+        self, custom_permissions_tuples: dict | None
+    ) -> dict[tuple[Any, str], str]:
+        """Returns a dict of {(model_cls, codename): name} from
+        `custom_permissions_tuples` after validating each codename.
+        """
+        names = {}
+        for model, codename_tuples in (custom_permissions_tuples or {}).items():
+            if codename_tuples:
+                try:
+                    model_cls = self.apps.get_model(model)
+                except LookupError as e:
+                    warn(f"{e}. Got {model}")
+                    continue
                 for codename_tpl in codename_tuples:
                     app_label, codename, name = self.get_from_codename_tuple(
                         codename_tpl, model_cls._meta.app_label
                     )
-                    try:
-                        self.permission_model_cls.objects.get(
-                            codename=codename, content_type=content_type
-                        )
-                    except ObjectDoesNotExist:
-                        self.permission_model_cls.objects.create(
-                            name=name, codename=codename, content_type=content_type
-                        )
-                    self.verify_codename_exists(f"{app_label}.{codename}", content_type)
+                    self.get_from_dotted_codename(f"{app_label}.{codename}")
+                    names[(model_cls, codename)] = name
+        return names
 
     def verify_codename_exists(self, codename, content_type):
         permission = None
@@ -251,6 +520,7 @@ class GroupUpdater:
             content_type__app_label=app_label, content_type__model=self.default_model_name
         ).delete()
         self.permission_model_cls.objects.filter(codename=codename).delete()
+        self.permission_index.reset()
         raise CodenameDoesNotExist(
             f"Unable to verify codename. {exception or ''} Got '{app_label}.{codename}'. \n"
             "YOU NEED TO RUN MIGRATE AGAIN!\n"
@@ -282,5 +552,4 @@ class GroupUpdater:
         permissions = self.get_permissions_qs_from_codenames(
             codenames, allow_multiple_objects=allow_multiple_objects
         )
-        for permission in permissions:
-            group.permissions.remove(permission)
+        group.permissions.remove(*permissions)
@@ -0,0 +1,45 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from django.contrib.auth.models import Permission
+
+
+class PermissionIndex:
+    """An in-memory index of permission model instances by
+    (app_label, codename).
+
+    The index is loaded with a single query on first access and
+    shared by all groups updated in one `AuthUpdater` run. Call
+    `reset` after creating or deleting permissions.
+    """
+
+    def __init__(self, permission_model_cls=None):
+        self.permission_model_cls = permission_model_cls
+        self._index: dict[tuple[str, str], list[Permission]] | None = None
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}(loaded={self._index is not None})"
+
+    @property
+    def index(self) -> dict[tuple[str, str], list[Permission]]:
+        if self._index is None:
+            self._index = {}
+            for permission in self.permission_model_cls.objects.select_related("content_type"):
+                self._index.setdefault(
+                    (permission.content_type.app_label, permission.codename), []
+                ).append(permission)
+        return self._index
+
+    def get(self, app_label: str, codename: str) -> list[Permission]:
+        """Returns a list of permissions for the app_label and codename.
+
+        The list is empty if the permission does not exist and has
+        more than one item if the codename is not unique for the
+        app_label.
+        """
+        return self.index.get((app_label, codename), [])
+
+    def reset(self) -> None:
+        self._index = None
@@ -1,9 +1,13 @@
+import getpass
+import socket
 import sys
 from typing import Optional
 
 from django.apps import apps as django_apps
-from django.core.exceptions import ObjectDoesNotExist
 from django.core.management.color import color_style
+from django.utils import timezone
+
+from ..permissions_cache import bump_permissions_cache_version
 
 style = color_style()
 
@@ -19,6 +23,7 @@ class RoleUpdater:
         verbose=None,
     ):
         self.roles = roles
+        self.role_changes: int = 0
         self.verbose = verbose
 
     @property
@@ -29,42 +34,137 @@ class RoleUpdater:
     def group_model_cls(self):
         return django_apps.get_model("auth.group")
 
-    def update_roles(self):
+    def update_roles(self) -> dict[str, tuple[int, int]]:
         """Updates or creates role model instances.
 
-        Role model instances refer to group instances. If a group by name
-        does not exist, it will be created.
+        Role model instances refer to group instances. All group names
+        are validated before anything is written, see
+        `validate_group_names`.
+
+        Returns a dict of {role name: (added, removed)} group links.
         """
         if self.verbose:
             sys.stdout.write(style.MIGRATE_HEADING(" - Updating roles:\n"))
-        index = 0
-        for role_name, groups in self.roles.items():
-            display_name = role_name.replace("_", " ").lower().title()
-            if self.verbose:
-                sys.stdout.write(f"   * updating groups for {role_name}.\n")
-            try:
-                role = self.role_model_cls.objects.get(name=role_name)
-            except ObjectDoesNotExist:
-                role = self.role_model_cls.objects.create(
-                    name=role_name,
-                    display_name=display_name,
-                    display_index=index,
-                )
-            role.display_name = display_name
-            role.display_index = index
-            role.save()
-            role.groups.clear()
-            for group_name in groups:
-                try:
-                    group = self.group_model_cls.objects.get(name=group_name)
-                except ObjectDoesNotExist:
-                    raise RoleUpdaterError(
-                        "Invalid group specified for role. "
-                        f"`{group_name}` is not a group. See role `{role}`."
-                    )
-                    # group = self.group_model_cls.objects.create(name=group_name)
-                role.groups.add(group)
-            index += 1
+        group_ids = dict(self.group_model_cls.objects.values_list("name", "id"))
+        self.validate_group_names(group_ids)
+        roles = self.update_or_create_roles()
+        changes = self.update_role_groups(roles, group_ids)
+        # bulk writes do not send post_save or m2m_changed
+        if self.role_changes or any(added or removed for added, removed in changes.values()):
+            bump_permissions_cache_version()
         if self.verbose:
+            for role_name, (added, removed) in changes.items():
+                sys.stdout.write(f"   * {role_name.lower()} (+{added}, -{removed})\n")
             sys.stdout.write("   Done.\n")
             sys.stdout.flush()
+        return changes
+
+    def validate_group_names(self, group_ids: dict[str, int]) -> None:
+        """Raises RoleUpdaterError listing every group name, per role,
+        that is not a group.
+        """
+        invalid = {
+            role_name: sorted(name for name in group_names if name not in group_ids)
+            for role_name, group_names in self.roles.items()
+        }
+        invalid = {k: v for k, v in invalid.items() if v}
+        if invalid:
+            raise RoleUpdaterError(
+                "Invalid group specified for role. "
+                + " ".join(
+                    f"`{', '.join(group_names)}` not a group. See role `{role_name}`."
+                    for role_name, group_names in invalid.items()
+                )
+            )
+
+    def update_or_create_roles(self) -> dict:
+        """Returns a dict of {role name: role model instance} after
+        creating missing roles and updating the display name and
+        display index of existing roles, if changed.
+
+        `bulk_update` does not call `save`, so the audit fields are
+        set here.
+
+        The number of roles created and updated is kept on
+        `role_changes`.
+        """
+        roles = self.get_roles()
+        create_roles = []
+        update_roles = []
+        modified = timezone.now()
+        hostname_modified = socket.gethostname()[:50]
+        try:
+            user_modified = getpass.getuser()[:50]
+        except (KeyError, OSError):
+            # no passwd entry, LOGNAME or USER, e.g. a container run as an arbitrary uid
+            user_modified = ""
+        for index, role_name in enumerate(self.roles):
+            display_name = role_name.replace("_", " ").lower().title()
+            try:
+                role = roles[role_name]
+            except KeyError:
+                create_roles.append(
+                    self.role_model_cls(
+                        name=role_name, display_name=display_name, display_index=index
+                    )
+                )
+            else:
+                if role.display_name != display_name or role.display_index != index:
+                    role.display_name = display_name
+                    role.display_index = index
+                    role.modified = modified
+                    role.hostname_modified = hostname_modified
+                    role.user_modified = user_modified
+                    update_roles.append(role)
+        if update_roles:
+            self.role_model_cls.objects.bulk_update(
+                update_roles,
+                [
+                    "display_name",
+                    "display_index",
+                    "modified",
+                    "hostname_modified",
+                    "user_modified",
+                ],
+            )
+        if create_roles:
+            self.role_model_cls.objects.bulk_create(create_roles)
+            roles = self.get_roles()
+        self.role_changes = len(create_roles) + len(update_roles)
+        return roles
+
+    def get_roles(self) -> dict:
+        return {
+            obj.name: obj
+            for obj in self.role_model_cls.objects.filter(name__in=list(self.roles))
+        }
+
+    def update_role_groups(self, roles: dict, group_ids: dict[str, int]):
+        """Adds and removes rows on the role/group through model so
+        that each role has exactly the groups in `self.roles`.
+        """
+        through_model_cls = self.role_model_cls.groups.through
+        current: dict = {}
+        for pk, role_id, group_id in through_model_cls.objects.filter(
+            role__in=roles.values()
+        ).values_list("id", "role_id", "group_id"):
+            current.setdefault(role_id, {}).update({group_id: pk})
+        changes = {}
+        add_rows = []
+        remove_ids = []
+        for role_name, group_names in self.roles.items():
+            role = roles[role_name]
+            expected_ids = {group_ids[name] for name in group_names}
+            current_ids = current.get(role.id, {})
+            add_ids = expected_ids - set(current_ids)
+            remove_group_ids = set(current_ids) - expected_ids
+            add_rows.extend(
+                through_model_cls(role_id=role.id, group_id=group_id) for group_id in add_ids
+            )
+            remove_ids.extend(current_ids[group_id] for group_id in remove_group_ids)
+            changes[role_name] = (len(add_ids), len(remove_group_ids))
+        if remove_ids:
+            through_model_cls.objects.filter(id__in=remove_ids).delete()
+        if add_rows:
+            through_model_cls.objects.bulk_create(add_rows)
+        return changes
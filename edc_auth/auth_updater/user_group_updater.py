@@ -0,0 +1,119 @@
+from __future__ import annotations
+
+import sys
+from collections import defaultdict
+
+from django.apps import apps as django_apps
+from django.contrib.auth import get_user_model
+from django.core.management.color import color_style
+
+from ..constants import CUSTOM_ROLE
+from ..permissions_cache import bump_permissions_cache_version
+
+style = color_style()
+
+
+class UserGroupUpdater:
+    """Syncs each user's groups with the groups of the user's roles.
+
+    Expected groups for every user are calculated from `Role.groups`
+    in a few queries. Only missing or extra rows on the user/group
+    through model are written. Users with the CUSTOM_ROLE are skipped,
+    see `UserProfile.add_groups_for_roles`.
+    """
+
+    batch_size = 500
+
+    def __init__(self, user_ids: list[int] | None = None, apps=None, verbose=None):
+        self.apps = apps or django_apps
+        self.user_ids = user_ids
+        self.verbose = verbose
+        self.user_model_cls = get_user_model()
+        self.user_group_model_cls = self.user_model_cls.groups.through
+        self.role_model_cls = self.apps.get_model("edc_auth.role")
+        self.user_profile_model_cls = self.apps.get_model("edc_auth.userprofile")
+
+    def update_user_groups(self) -> dict[int, tuple[int, int]]:
+        """Returns a dict of {user_id: (added, removed)} for each
+        user whose groups were changed.
+        """
+        if self.verbose:
+            sys.stdout.write(style.MIGRATE_HEADING(" - Updating user groups:\n"))
+        changes: dict[int, tuple[int, int]] = {}
+        add_rows = []
+        remove_ids = []
+        expected_group_ids = self.get_expected_group_ids()
+        current_rows = self.get_current_rows()
+        for user_id, group_ids in expected_group_ids.items():
+            current_group_ids = {group_id for _, group_id in current_rows[user_id]}
+            add_group_ids = group_ids - current_group_ids
+            remove_group_ids = current_group_ids - group_ids
+            if add_group_ids or remove_group_ids:
+                add_rows.extend(
+                    self.user_group_model_cls(user_id=user_id, group_id=group_id)
+                    for group_id in add_group_ids
+                )
+                remove_ids.extend(
+                    pk
+                    for pk, group_id in current_rows[user_id]
+                    if group_id in remove_group_ids
+                )
+                changes[user_id] = (len(add_group_ids), len(remove_group_ids))
+        for index in range(0, len(remove_ids), self.batch_size):
+            self.user_group_model_cls.objects.filter(
+                id__in=remove_ids[index : index + self.batch_size]
+            ).delete()
+        if add_rows:
+            self.user_group_model_cls.objects.bulk_create(add_rows, batch_size=self.batch_size)
+        if changes:
+            bump_permissions_cache_version()
+        if self.verbose:
+            added = sum(added for added, _ in changes.values())
+            removed = sum(removed for _, removed in changes.values())
+            sys.stdout.write(f"   * {len(changes)} users updated (+{added}, -{removed})\n")
+            sys.stdout.write("   Done.\n")
+        return changes
+
+    def get_expected_group_ids(self) -> dict[int, set[int]]:
+        """Returns a dict of {user_id: {group_id, ...}} for users to be
+        updated.
+
+        Users with the CUSTOM_ROLE are not included.
+        """
+        group_ids_by_role: dict[int, set[int]] = defaultdict(set)
+        for role_id, group_id in self.role_model_cls.groups.through.objects.values_list(
+            "role_id", "group_id"
+        ):
+            group_ids_by_role[role_id].add(group_id)
+        custom_role_ids = set(
+            self.role_model_cls.objects.filter(name=CUSTOM_ROLE).values_list("id", flat=True)
+        )
+        role_ids_by_user: dict[int, set[int]] = defaultdict(set)
+        qs = self.user_profile_model_cls.roles.through.objects.all()
+        if self.user_ids is not None:
+            qs = qs.filter(userprofile__user_id__in=self.user_ids)
+        for user_id, role_id in qs.values_list("userprofile__user_id", "role_id"):
+            role_ids_by_user[user_id].add(role_id)
+        qs = self.user_model_cls.objects.all()
+        if self.user_ids is not None:
+            qs = qs.filter(id__in=self.user_ids)
+        expected_group_ids: dict[int, set[int]] = {}
+        for user_id in qs.values_list("id", flat=True):
+            role_ids = role_ids_by_user[user_id]
+            if not role_ids & custom_role_ids:
+                expected_group_ids[user_id] = set().union(
+                    *[group_ids_by_role[role_id] for role_id in role_ids]
+                )
+        return expected_group_ids
+
+    def get_current_rows(self) -> dict[int, list[tuple[int, int]]]:
+        """Returns a dict of {user_id: [(pk, group_id), ...]} from the
+        user/group through model.
+        """
+        current_rows: dict[int, list[tuple[int, int]]] = defaultdict(list)
+        qs = self.user_group_model_cls.objects.all()
+        if self.user_ids is not None:
+            qs = qs.filter(user_id__in=self.user_ids)
+        for pk, user_id, group_id in qs.values_list("id", "user_id", "group_id"):
+            current_rows[user_id].append((pk, group_id))
+        return current_rows
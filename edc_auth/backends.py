@@ -1,23 +1,73 @@
+from django.apps import apps as django_apps
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.contrib.auth.backends import ModelBackend
 
+from .permissions_cache import get_cached_user_data
+
 UserModel = get_user_model()
 
 
 class ModelBackendWithSite(ModelBackend):
     """An authentication backend to only allow a login
     associated with the current SITE_ID.
+
+    Resolved permissions are kept in a shared cache, see
+    `edc_auth.permissions_cache`, and memoized on the user object,
+    like Django's `_perm_cache`, for the rest of the request.
     """
 
     def authenticate(self, request, username=None, password=None, **kwargs):
         user = super().authenticate(request, username=username, password=password)
         if user:
-            sites = [obj.id for obj in user.userprofile.sites.all()]
+            if user.is_superuser:
+                return user
             try:
                 site_id = request.site.id
             except AttributeError:
                 site_id = settings.SITE_ID
-            if user.is_superuser or site_id in sites:
+            if site_id in self.get_allowed_site_ids(user):
                 return user
         return None
+
+    def get_allowed_site_ids(self, user_obj) -> frozenset[int]:
+        """Returns the ids of the sites the user may access from the
+        shared cache.
+        """
+        return self.get_cached_user_data(user_obj)["site_ids"]
+
+    def get_all_permissions(self, user_obj, obj=None):
+        if not user_obj.is_active or user_obj.is_anonymous or obj is not None:
+            return set()
+        if not hasattr(user_obj, "_perm_cache"):
+            user_obj._perm_cache = set(self.get_cached_user_data(user_obj)["permissions"])
+        return user_obj._perm_cache
+
+    def get_cached_user_data(self, user_obj) -> dict:
+        """Returns a dict of the user's resolved permissions and
+        site ids from the shared cache.
+
+        Memoized on the user object, so the cache is read once per
+        request.
+        """
+        if not hasattr(user_obj, "_edc_auth_cache"):
+            user_obj._edc_auth_cache = get_cached_user_data(
+                user_obj, lambda: self.get_user_data(user_obj)
+            )
+        return user_obj._edc_auth_cache
+
+    def get_user_data(self, user_obj) -> dict:
+        user_profile_model_cls = django_apps.get_model("edc_auth.userprofile")
+        return dict(
+            permissions=frozenset(
+                {
+                    *self.get_user_permissions(user_obj),
+                    *self.get_group_permissions(user_obj),
+                }
+            ),
+            site_ids=frozenset(
+                user_profile_model_cls.sites.through.objects.filter(
+                    userprofile__user_id=user_obj.id
+                ).values_list("site_id", flat=True)
+            ),
+        )
@@ -0,0 +1,196 @@
+from __future__ import annotations
+
+import logging
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator
+
+from django.apps import apps as django_apps
+from django.contrib.auth import get_user_model
+from django.db import transaction
+
+from .auth_objects import CUSTOM_ROLE, STAFF_ROLE
+from .permissions_cache import bump_permissions_cache_version
+
+logger = logging.getLogger(__name__)
+
+deferred_role_updates: ContextVar[DeferredRoleUpdates | None] = ContextVar(
+    "deferred_role_updates", default=None
+)
+
+
+class DeferredRoleUpdates:
+    """Collects `UserProfile.roles` changes and updates the groups of
+    each affected user once, in bulk.
+
+    Has the same effect as `UserProfile.add_groups_for_roles` and
+    `UserProfile.remove_groups_for_roles` called per m2m event:
+        * groups of the user's roles are added unless the user has
+          the CUSTOM_ROLE;
+        * groups of removed roles are removed unless provided by a
+          remaining role;
+        * if the CUSTOM_ROLE is removed, and not added again, the
+          user's groups are cleared and the STAFF_ROLE is added. Other
+          roles assigned after the removal are kept.
+
+    See `defer_role_group_updates`.
+    """
+
+    def __init__(self):
+        self.profile_ids: set[int] = set()
+        self.removed_role_ids: dict[int, set] = defaultdict(set)
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}(profiles={len(self.profile_ids)})"
+
+    def collect(self, profile, action: str, pk_set: set | None) -> None:
+        self.profile_ids.add(profile.pk)
+        if action == "post_remove":
+            self.removed_role_ids[profile.pk].update(pk_set or [])
+
+    def reconcile(self) -> dict[int, tuple[int, int]]:
+        """Returns a dict of {user_id: (added, removed)} after
+        updating user groups for all collected profiles.
+        """
+        role_model_cls = django_apps.get_model("edc_auth.role")
+        user_profile_model_cls = django_apps.get_model("edc_auth.userprofile")
+        user_group_model_cls = get_user_model().groups.through
+        role_ids = dict(role_model_cls.objects.values_list("name", "id"))
+        user_ids = dict(
+            user_profile_model_cls.objects.filter(id__in=self.profile_ids).values_list(
+                "id", "user_id"
+            )
+        )
+        current_role_ids: dict[int, set] = defaultdict(set)
+        for profile_id, role_id in user_profile_model_cls.roles.through.objects.filter(
+            userprofile_id__in=list(user_ids)
+        ).values_list("userprofile_id", "role_id"):
+            current_role_ids[profile_id].add(role_id)
+        reset_ids = {
+            profile_id
+            for profile_id in user_ids
+            if role_ids.get(CUSTOM_ROLE) in self.removed_role_ids[profile_id]
+            and role_ids.get(CUSTOM_ROLE) not in current_role_ids[profile_id]
+        }
+        if reset_ids:
+            self.reset_to_staff_role(
+                reset_ids, user_ids, role_ids.get(STAFF_ROLE), current_role_ids
+            )
+        group_ids_by_role: dict = defaultdict(set)
+        for role_id, group_id in role_model_cls.groups.through.objects.values_list(
+            "role_id", "group_id"
+        ):
+            group_ids_by_role[role_id].add(group_id)
+        current_rows: dict[int, dict[int, int]] = defaultdict(dict)
+        for pk, user_id, group_id in user_group_model_cls.objects.filter(
+            user_id__in=list(user_ids.values())
+        ).values_list("id", "user_id", "group_id"):
+            current_rows[user_id][group_id] = pk
+        changes = {}
+        add_rows = []
+        remove_ids = []
+        for profile_id, user_id in user_ids.items():
+            expected = set().union(
+                *[group_ids_by_role[role_id] for role_id in current_role_ids[profile_id]]
+            )
+            add_group_ids = set()
+            if role_ids.get(CUSTOM_ROLE) not in current_role_ids[profile_id]:
+                add_group_ids = expected - set(current_rows[user_id])
+            remove_group_ids = set()
+            if profile_id not in reset_ids:
+                remove_group_ids = set(current_rows[user_id]) & (
+                    set().union(
+                        *[
+                            group_ids_by_role[role_id]
+                            for role_id in self.removed_role_ids[profile_id]
+                        ]
+                    )
+                    - expected
+                )
+            add_rows.extend(
+                user_group_model_cls(user_id=user_id, group_id=group_id)
+                for group_id in add_group_ids
+            )
+            remove_ids.extend(current_rows[user_id][group_id] for group_id in remove_group_ids)
+            if add_group_ids or remove_group_ids or profile_id in reset_ids:
+                changes[user_id] = (len(add_group_ids), len(remove_group_ids))
+        if remove_ids:
+            user_group_model_cls.objects.filter(id__in=remove_ids).delete()
+        if add_rows:
+            user_group_model_cls.objects.bulk_create(add_rows)
+        for user_id in changes:
+            bump_permissions_cache_version(user_id=user_id)
+        self.profile_ids = set()
+        self.removed_role_ids = defaultdict(set)
+        return changes
+
+    @staticmethod
+    def reset_to_staff_role(
+        profile_ids: set[int], user_ids: dict, staff_role_id, current_role_ids: dict
+    ) -> None:
+        """Clears groups and adds the STAFF_ROLE, if missing, for
+        profiles whose CUSTOM_ROLE was removed.
+
+        Roles added after the CUSTOM_ROLE was removed are kept, as
+        when `remove_groups_for_roles` is followed by
+        `add_groups_for_roles`. Updates `current_role_ids`.
+        """
+        user_profile_model_cls = django_apps.get_model("edc_auth.userprofile")
+        role_through_model_cls = user_profile_model_cls.roles.through
+        get_user_model().groups.through.objects.filter(
+            user_id__in=[user_ids[pk] for pk in profile_ids]
+        ).delete()
+        role_through_model_cls.objects.bulk_create(
+            [
+                role_through_model_cls(userprofile_id=pk, role_id=staff_role_id)
+                for pk in profile_ids
+                if staff_role_id not in current_role_ids[pk]
+            ]
+        )
+        for pk in profile_ids:
+            current_role_ids[pk].add(staff_role_id)
+
+
+@contextmanager
+def defer_role_group_updates(using: str | None = None) -> Iterator[DeferredRoleUpdates]:
+    """Within this context, changes to `UserProfile.roles` do not
+    update user groups per m2m event.
+
+    Affected profiles are collected and their groups updated once
+    when the transaction commits, also if the block raises after
+    some changes were written. See `DeferredRoleUpdates`.
+
+    If the block raises outside of an atomic block, errors from the
+    update are logged, not raised, so the original exception
+    propagates.
+
+    For example:
+
+        with transaction.atomic(), defer_role_group_updates():
+            for profile in profiles:
+                profile.roles.add(role)
+    """
+    deferred = deferred_role_updates.get()
+    if deferred is not None:
+        yield deferred
+        return
+    deferred = DeferredRoleUpdates()
+    token = deferred_role_updates.set(deferred)
+    try:
+        yield deferred
+    except BaseException:
+        deferred_role_updates.reset(token)
+        if deferred.profile_ids:
+            if transaction.get_connection(using).in_atomic_block:
+                transaction.on_commit(deferred.reconcile, using=using)
+            else:
+                try:
+                    deferred.reconcile()
+                except Exception:
+                    logger.exception("Unable to update user groups for deferred role changes.")
+        raise
+    else:
+        deferred_role_updates.reset(token)
+        if deferred.profile_ids:
+            transaction.on_commit(deferred.reconcile, using=using)
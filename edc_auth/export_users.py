@@ -1,45 +1,86 @@
 import csv
+import time
 from datetime import datetime
 
 from django.contrib.auth.models import User
+from django.db import connection
 
+export_fieldnames = [
+    "username",
+    "password",
+    "is_staff",
+    "is_active",
+    "first_name",
+    "last_name",
+    "job_title",
+    "email",
+    "mobile",
+    "alternate_email",
+    "site_names",
+    "role_names",
+]
 
-def export_users(path):
+
+class QueryCounter:
+    """Counts queries executed on a connection.
+
+    Use as a connection execute wrapper.
+    """
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def export_users(path, chunk_size: int | None = None) -> dict:
+    """Writes users to a CSV file.
+
+    Users are read in chunks of `chunk_size` with the user profile,
+    sites and roles prefetched for each chunk and each row is written
+    as it is read.
+
+    Returns a dict with the number of rows and queries and the rate
+    in rows per second.
+    """
     path = path or f"edc_users_{datetime.now().strftime('%Y%m%d%H%M%S')}.csv"
-    user = {
-        "username": None,
-        "password": None,
-        "is_staff": None,
-        "is_active": None,
-        "first_name": None,
-        "last_name": None,
-        "job_title": None,
-        "email": None,
-        "mobile": None,
-        "alternate_email": None,
-        "site_names": None,
-        "role_names": None,
-    }
-
-    with open(path, "w+") as f:
-        writer = csv.DictWriter(f, fieldnames=user, delimiter="|")
+    queryset = (
+        User.objects.select_related("userprofile")
+        .prefetch_related("userprofile__sites", "userprofile__roles")
+        .order_by("username")
+    )
+    query_counter = QueryCounter()
+    rows = 0
+    start = time.perf_counter()
+    with connection.execute_wrapper(query_counter), open(path, "w+") as f:
+        writer = csv.DictWriter(f, fieldnames=export_fieldnames, delimiter="|")
         writer.writeheader()
-        for user in User.objects.all().order_by("username"):
-            site_names = ",".join([s.name for s in user.userprofile.sites.all()])
-            role_names = ",".join([g.name for g in user.userprofile.roles.all()])
-            user = {
-                "username": user.username,
-                "password": user.password,
-                "is_staff": user.is_staff,
-                "is_active": user.is_active,
-                "first_name": user.first_name,
-                "last_name": user.last_name,
-                "job_title": user.userprofile.job_title,
-                "email": user.email,
-                "mobile": user.userprofile.mobile,
-                "alternate_email": user.userprofile.alternate_email,
-                "site_names": site_names or "",
-                "role_names": role_names or "",
-            }
-            writer.writerow(user)
+        for user in queryset.iterator(chunk_size=chunk_size or 500):
+            writer.writerow(
+                {
+                    "username": user.username,
+                    "password": user.password,
+                    "is_staff": user.is_staff,
+                    "is_active": user.is_active,
+                    "first_name": user.first_name,
+                    "last_name": user.last_name,
+                    "job_title": user.userprofile.job_title,
+                    "email": user.email,
+                    "mobile": user.userprofile.mobile,
+                    "alternate_email": user.userprofile.alternate_email,
+                    "site_names": ",".join([s.name for s in user.userprofile.sites.all()]),
+                    "role_names": ",".join([r.name for r in user.userprofile.roles.all()]),
+                }
+            )
+            rows += 1
+    seconds = time.perf_counter() - start
     print(f"Done. See file `{path}` in the current directory.")
+    return dict(
+        path=path,
+        rows=rows,
+        queries=query_counter.count,
+        seconds=seconds,
+        rows_per_second=rows / seconds if seconds else 0,
+    )
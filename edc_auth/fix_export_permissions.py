@@ -11,67 +11,143 @@ class ExportPermissionsFixer:
 
     For example. see `edc_models.BaseUuidModel.Meta`
 
+    Content types and existing permissions for all models are read
+    in two queries. Missing permissions are created and only names
+    that differ are updated. If `dry_run`, nothing is written and
+    the planned changes are printed.
+
     Usage:
         fixer = ExportPermissionsFixer(warn_only=True)
         fixer.fix()
     """
 
-    def __init__(self, app_label=None, verbose=None, warn_only=None):
+    actions = ["import", "export"]
+
+    def __init__(self, app_label=None, verbose=None, warn_only=None, dry_run=None):
         if app_label:
             self.app_configs = [django_apps.get_app_config(app_label)]
         else:
             self.app_configs = django_apps.get_app_configs()
         self.verbose = verbose if verbose is not None else False
         self.warn_only = warn_only
+        self.dry_run = dry_run
+        self.create_permissions = []
+        self.update_permissions = []
+
+    @property
+    def permission_model_cls(self):
+        return django_apps.get_model("auth.permission")
 
-    def fix(self):
+    @property
+    def content_type_model_cls(self):
+        return django_apps.get_model("contenttypes.contenttype")
+
+    def fix(self) -> tuple[int, int]:
         """Add "import" and "export" to default permissions of add, change, delete, view.
 
         Needed for BaseUuidModel models with an initial migration created before edc==0.1.24.
 
         Provided for ``django-import-export`` integration
-        """
 
+        Returns a tuple of the number of permissions created and updated.
+        """
         if self.verbose:
             print("Adding `import` and `export` to default permissions.")
+        models = []
         for app_config in self.app_configs:
             if self.verbose:
                 print(f"  * updating {app_config.name}")
-            for model in app_config.get_models():
-                self.fix_for_model(model)
+            models.extend(app_config.get_models())
+        created, updated = self.fix_for_models(models)
         if self.verbose:
             print("Done")
+        return created, updated
+
+    def fix_for_model(self, model) -> tuple[int, int]:
+        return self.fix_for_models([model])
 
-    def fix_for_model(self, model):
+    def fix_for_models(self, models) -> tuple[int, int]:
         from edc_model import models as edc_models
 
-        if issubclass(model, (edc_models.BaseUuidModel,)):
-            permission_model_cls = django_apps.get_model("auth.permission")
-            content_type_model_cls = django_apps.get_model("contenttypes.contenttype")
+        models = [model for model in models if issubclass(model, (edc_models.BaseUuidModel,))]
+        self.plan(models)
+        if self.dry_run:
+            self.print_planned_changes()
+        else:
+            if self.create_permissions:
+                self.permission_model_cls.objects.bulk_create(self.create_permissions)
+            if self.update_permissions:
+                self.permission_model_cls.objects.bulk_update(
+                    self.update_permissions, ["name"]
+                )
             if self.verbose:
-                print(f"    - {model._meta.label_lower}")
-            try:
-                app_label, model_name = model._meta.label_lower.split(".")
-                content_type = content_type_model_cls.objects.get(
-                    app_label=app_label,
-                    model__iexact=model_name,
+                print(
+                    f"    created {len(self.create_permissions)}, "
+                    f"updated {len(self.update_permissions)}"
                 )
-            except ObjectDoesNotExist as e:
+        return len(self.create_permissions), len(self.update_permissions)
+
+    def plan(self, models) -> None:
+        """Sets the lists of permissions to create and to update."""
+        content_types = self.get_content_types(models)
+        existing = {
+            (obj.content_type_id, obj.codename): obj
+            for obj in self.permission_model_cls.objects.select_related("content_type").filter(
+                content_type__in=content_types.values(),
+                codename__in=[
+                    f"{action}_{model._meta.model_name}"
+                    for model in models
+                    for action in self.actions
+                ],
+            )
+        }
+        self.create_permissions = []
+        self.update_permissions = []
+        for model in [m for m in models if m._meta.label_lower in content_types]:
+            content_type = content_types[model._meta.label_lower]
+            if self.verbose:
+                print(f"    - {model._meta.label_lower}")
+            for action in self.actions:
+                codename = f"{action}_{model._meta.model_name}"
+                name = f"Can {action} {model._meta.verbose_name}"
+                try:
+                    obj = existing[(content_type.id, codename)]
+                except KeyError:
+                    self.create_permissions.append(
+                        self.permission_model_cls(
+                            content_type=content_type, codename=codename, name=name
+                        )
+                    )
+                else:
+                    if obj.name != name:
+                        obj.name = name
+                        self.update_permissions.append(obj)
+
+    def get_content_types(self, models) -> dict:
+        """Returns a dict of {label_lower: content type} read in one
+        query.
+        """
+        content_types = {
+            f"{obj.app_label}.{obj.model}": obj
+            for obj in self.content_type_model_cls.objects.filter(
+                app_label__in={model._meta.app_label for model in models}
+            )
+        }
+        for model in models:
+            if model._meta.label_lower not in content_types:
+                msg = f"ContentType matching query does not exist. Got {model}."
                 if self.warn_only:
-                    warn(f"ObjectDoesNotExist: {e} Got {model}.")
+                    warn(f"ObjectDoesNotExist: {msg}")
                 else:
-                    raise ObjectDoesNotExist(f"{e} Got {model}.")
-            else:
-                for action in ["import", "export"]:
-                    codename = f"{action}_{model._meta.label_lower.split('.')[1]}"
-                    opts = dict(content_type=content_type, codename=codename)
-                    try:
-                        obj = permission_model_cls.objects.get(**opts)
-                    except ObjectDoesNotExist:
-                        opts.update(name=f"Can {action} {model._meta.verbose_name}")
-                        permission_model_cls.objects.create(**opts)
-                        if self.verbose:
-                            print(f"       created for {model._meta.label_lower}")
-                    else:
-                        obj.name = f"Can {action} {model._meta.verbose_name}"
-                        obj.save()
+                    raise ObjectDoesNotExist(msg)
+        return content_types
+
+    def print_planned_changes(self):
+        print(
+            f"Dry run. Would create {len(self.create_permissions)} and "
+            f"update {len(self.update_permissions)} permissions."
+        )
+        for obj in self.create_permissions:
+            print(f"  + {obj.content_type.app_label}.{obj.codename} '{obj.name}'")
+        for obj in self.update_permissions:
+            print(f"  ~ {obj.content_type.app_label}.{obj.codename} '{obj.name}'")
@@ -13,7 +13,7 @@ from edc_randomization.blinding import (
 )
 
 from .models import UserProfile
-from .utils import get_codenames_for_user
+from .utils import get_change_codenames
 
 
 class UserChangeForm(BaseForm):
@@ -37,10 +37,9 @@ class UserProfileForm(forms.ModelForm):
         cleaned_data = super().clean()
 
         if self.cleaned_data.get("is_multisite_viewer"):
-            codenames = get_codenames_for_user(
+            if c := get_change_codenames(
                 user=self.cleaned_data.get("user"), roles=self.cleaned_data.get("roles")
-            )
-            if c := [c for c in codenames if "add_" in c or "change_" in c or "delete_" in c]:
+            ):
                 raise forms.ValidationError(
                     {
                         "is_multisite_viewer": (
@@ -76,10 +75,8 @@ class UserProfileForm(forms.ModelForm):
                 )
         qs = self.cleaned_data.get("roles")
         if qs and qs.count() > 0:
-            for role in qs:
-                if RANDO_UNBLINDED in [
-                    obj.name for obj in role.groups.all()
-                ] and user_is_blinded(self.instance.user.username):
+            for role in qs.filter(groups__name=RANDO_UNBLINDED):
+                if user_is_blinded(self.instance.user.username):
                     raise forms.ValidationError(
                         {
                             "roles": format_html(
@@ -9,12 +9,16 @@ from django.contrib.auth.models import User
 from django.contrib.sites.models import Site
 from django.core.exceptions import ObjectDoesNotExist
 from django.core.mail import EmailMessage
+from django.db import transaction
 from edc_protocol.research_protocol_config import ResearchProtocolConfig
 from mempass import PasswordGenerator
 
+from .auth_updater.user_group_updater import UserGroupUpdater
 from .constants import ACCOUNT_MANAGER_ROLE, STAFF_ROLE
+from .deferred_role_updates import defer_role_group_updates
 from .export_users import export_users
-from .models import Role
+from .models import Role, UserProfile
+from .permissions_cache import bump_permissions_cache_version
 
 required_role_names = {STAFF_ROLE: "Staff"}
 
@@ -72,6 +76,7 @@ def import_users(
     verbose: Optional[Any] = None,
     export_to_file: Optional[Any] = None,
     limit_to_username: Optional[str] = None,
+    bulk: Optional[bool] = None,
     **kwargs,
 ):
     """Import users from a CSV file with columns:
@@ -87,7 +92,40 @@ def import_users(
     alternate_email
     site_names: a comma-separated list of sites
     role_names: a comma-separated list of roles
+
+    If `bulk` is True, the whole file is validated first and then
+    imported in one transaction. See `BulkUserImporter`.
     """
+    rows = read_users_from_file(path, limit_to_username=limit_to_username)
+    if bulk:
+        BulkUserImporter(
+            rows,
+            resource_name=resource_name,
+            send_email_to_user=send_email_to_user,
+            verbose=verbose,
+            resend_as_newly_created=resend_as_newly_created,
+            **kwargs,
+        )
+    else:
+        with defer_role_group_updates():
+            for opts in rows:
+                UserImporter(
+                    resource_name=resource_name,
+                    send_email_to_user=send_email_to_user,
+                    verbose=verbose,
+                    resend_as_newly_created=resend_as_newly_created,
+                    **opts,
+                    **kwargs,
+                )
+    if export_to_file:
+        export_users(f"edc_users_imported_{datetime.now().strftime('%Y%m%d%H%M%S')}")
+
+
+def read_users_from_file(path: str, limit_to_username: Optional[str] = None) -> List[dict]:
+    """Returns a list of dicts of UserImporter options, one per row
+    in the CSV file.
+    """
+    rows = []
     path = os.path.expanduser(path)
     with open(path) as f:
         reader = csv.DictReader(f, delimiter="|")
@@ -112,16 +150,8 @@ def import_users(
             opts.update(job_title=csv_data.get("job_title"))
             opts.update(is_active=True if csv_data.get("is_active") == "True" else False)
             opts.update(is_staff=True if csv_data.get("is_staff") == "True" else False)
-            UserImporter(
-                resource_name=resource_name,
-                send_email_to_user=send_email_to_user,
-                verbose=verbose,
-                resend_as_newly_created=resend_as_newly_created,
-                **opts,
-                **kwargs,
-            )
-    if export_to_file:
-        export_users(f"edc_users_imported_{datetime.now().strftime('%Y%m%d%H%M%S')}")
+            rows.append(opts)
+    return rows
 
 
 class UserImporter:
@@ -281,3 +311,231 @@ class UserImporter:
             last_name = "".join(self.last_name.split(" ")).lower()
             return f"{self.first_name.lower()[0]}{last_name}"
         return None
+
+
+class BulkUserImporter:
+    """Imports users from a list of UserImporter options in one
+    transaction.
+
+    Sites and roles are loaded once and all rows are validated
+    before anything is written. Users and user profiles are written
+    with `bulk_create`/`bulk_update` and user profile sites and roles
+    with bulk inserts on the through models. Groups for all imported
+    users are updated in a single pass at the end, see
+    `UserGroupUpdater`.
+
+    Note: model `save` and the post_save and m2m_changed signals are
+    not called for the imported users and user profiles.
+    """
+
+    resource_name = "example.com"
+    password_nwords = 4
+    created_email_template = add_user_template
+    updated_email_template = change_user_template
+    batch_size = 500
+
+    def __init__(
+        self,
+        rows: List[dict],
+        resource_name: Optional[str] = None,
+        created_email_template: Optional[Template] = None,
+        updated_email_template: Optional[Template] = None,
+        send_email_to_user: Optional[Any] = None,
+        test_email_address: Optional[Any] = None,
+        resend_as_new: Optional[Any] = None,
+        resend_as_newly_created: Optional[Any] = None,
+        nwords: Optional[int] = None,
+        verbose: Optional[Any] = None,
+        **kwargs,
+    ):
+        self.password_generator = PasswordGenerator(
+            nwords=nwords or self.password_nwords, **kwargs
+        )
+        self.resource_name = resource_name or self.resource_name
+        self.resend_as_newly_created = resend_as_new or resend_as_newly_created
+        self.test_email_address = test_email_address
+        self.created_email_template = created_email_template or self.created_email_template
+        self.updated_email_template = updated_email_template or self.updated_email_template
+        self.verbose = verbose
+        self.sites = {obj.name: obj for obj in Site.objects.all()}
+        self.roles = {obj.name.lower(): obj for obj in Role.objects.all()}
+        self.users: dict[str, dict] = self.validate(rows)
+        with transaction.atomic():
+            self.update_users()
+        self.project_name = ResearchProtocolConfig().protocol_name
+        if self.verbose:
+            created = len([data for data in self.users.values() if data["created"]])
+            print(
+                f"Imported {len(self.users)} users. "
+                f"Created {created}, updated {len(self.users) - created}."
+            )
+        if send_email_to_user:
+            for data in self.users.values():
+                email_message = self.get_email_message(data)
+                try:
+                    email_message.send(fail_silently=False)
+                except ConnectionRefusedError:
+                    print(email_message.body)
+
+    def validate(self, rows: List[dict]) -> dict[str, dict]:
+        """Returns a dict of cleaned data by username or raises
+        a UserImporterError listing every invalid row.
+        """
+        errors: List[str] = []
+        users: dict[str, dict] = {}
+        for opts in rows:
+            username = opts.get("username") or self.get_username(
+                opts.get("first_name"), opts.get("last_name")
+            )
+            if not username or not re.match(r"^\w+$", username):
+                errors.append(f"Invalid username. Got username={username}")
+                continue
+            if username in users:
+                errors.append(f"Duplicate username. Got {username}")
+                continue
+            role_names = list(opts.get("role_names") or [STAFF_ROLE])
+            role_names.extend(required_role_names)
+            site_names = opts.get("site_names") or []
+            if ACCOUNT_MANAGER_ROLE in role_names:
+                site_names = list(self.sites)
+            for site_name in site_names:
+                if site_name not in self.sites:
+                    errors.append(
+                        f"Unknown site for user. Expected one of {list(self.sites)}. "
+                        f"Got {username}, {site_name}."
+                    )
+            for role_name in role_names:
+                if role_name.lower() not in self.roles:
+                    errors.append(
+                        f"Unknown role for user. Got role `{role_name}` "
+                        f"for user `{username}`"
+                    )
+            try:
+                email, alternate_email = opts.get("email").split(",")
+            except (ValueError, AttributeError):
+                email, alternate_email = opts.get("email"), opts.get("alternate_email")
+            users[username] = dict(
+                username=username,
+                first_name=opts.get("first_name"),
+                last_name=opts.get("last_name"),
+                email=email,
+                alternate_email=alternate_email,
+                mobile=opts.get("mobile"),
+                job_title=opts.get("job_title") or "staff member",
+                is_active=opts.get("is_active") or False,
+                is_staff=opts.get("is_staff") or False,
+                sites=[self.sites.get(name) for name in dict.fromkeys(site_names)],
+                roles=list(dict.fromkeys(self.roles.get(name.lower()) for name in role_names)),
+            )
+        if errors:
+            raise UserImporterError("\n".join(errors))
+        return users
+
+    def update_users(self) -> None:
+        """Creates or updates users, user profiles and their sites,
+        roles and groups.
+        """
+        existing_users = {
+            obj.username: obj for obj in User.objects.filter(username__in=self.users)
+        }
+        created_users, updated_users = [], []
+        for username, data in self.users.items():
+            data.update(created=username not in existing_users)
+            user = existing_users.get(username) or User(username=username, is_superuser=False)
+            user.first_name = data["first_name"]
+            user.last_name = data["last_name"]
+            user.email = data["email"]
+            user.is_staff = data["is_staff"]
+            user.is_active = data["is_active"]
+            data.update(password=self.password_generator.get_password())
+            user.set_password(data["password"])
+            if data["created"]:
+                created_users.append(user)
+            else:
+                updated_users.append(user)
+        User.objects.bulk_create(created_users, batch_size=self.batch_size)
+        User.objects.bulk_update(
+            updated_users,
+            ["first_name", "last_name", "email", "is_staff", "is_active", "password"],
+            batch_size=self.batch_size,
+        )
+        user_ids = dict(
+            User.objects.filter(username__in=self.users).values_list("username", "id")
+        )
+        user_profile_model_cls = UserProfile
+        user_profiles = {
+            obj.user_id: obj
+            for obj in user_profile_model_cls.objects.filter(user_id__in=user_ids.values())
+        }
+        user_profile_model_cls.objects.bulk_create(
+            [
+                user_profile_model_cls(user_id=pk)
+                for pk in user_ids.values()
+                if pk not in user_profiles
+            ],
+            batch_size=self.batch_size,
+        )
+        user_profiles = {
+            obj.user_id: obj
+            for obj in user_profile_model_cls.objects.filter(user_id__in=user_ids.values())
+        }
+        site_rows, role_rows = [], []
+        site_through_model_cls = user_profile_model_cls.sites.through
+        role_through_model_cls = user_profile_model_cls.roles.through
+        for username, data in self.users.items():
+            user_profile = user_profiles[user_ids[username]]
+            user_profile.job_title = data["job_title"]
+            user_profile.mobile = data["mobile"]
+            user_profile.alternate_email = data["alternate_email"]
+            site_rows.extend(
+                site_through_model_cls(userprofile_id=user_profile.id, site_id=site.id)
+                for site in data["sites"]
+            )
+            role_rows.extend(
+                role_through_model_cls(userprofile_id=user_profile.id, role_id=role.id)
+                for role in data["roles"]
+            )
+        user_profile_model_cls.objects.bulk_update(
+            user_profiles.values(),
+            ["job_title", "mobile", "alternate_email"],
+            batch_size=self.batch_size,
+        )
+        user_profile_ids = [obj.id for obj in user_profiles.values()]
+        site_through_model_cls.objects.filter(userprofile_id__in=user_profile_ids).delete()
+        site_through_model_cls.objects.bulk_create(site_rows, batch_size=self.batch_size)
+        role_through_model_cls.objects.filter(userprofile_id__in=user_profile_ids).delete()
+        role_through_model_cls.objects.bulk_create(role_rows, batch_size=self.batch_size)
+        UserGroupUpdater(user_ids=list(user_ids.values())).update_user_groups()
+        bump_permissions_cache_version()
+
+    def get_email_message(self, data: dict) -> EmailMessage:
+        if data["created"] or self.resend_as_newly_created:
+            body = self.created_email_template
+        else:
+            body = self.updated_email_template
+        context = dict(
+            first_name=data["first_name"],
+            username=data["username"],
+            password=data["password"],
+            job_title=data["job_title"],
+            project_name=self.project_name,
+            resource_name=self.resource_name,
+            site_names=(
+                "\n  - ".join([site.name for site in data["sites"]])
+                or "(You have not been granted access to any sites)"
+            ),
+            role_names="\n  - ".join([role.display_name for role in data["roles"]]),
+        )
+        return EmailMessage(
+            f"{self.project_name} EDC: Your {self.resource_name} user account is ready.",
+            body=body.safe_substitute(context),
+            from_email="noreply@clinicedc.org",
+            to=(self.test_email_address or data["email"],),
+        )
+
+    @staticmethod
+    def get_username(first_name: Optional[str], last_name: Optional[str]) -> Optional[str]:
+        if first_name and last_name:
+            last_name = "".join(last_name.split(" ")).lower()
+            return f"{first_name.lower()[0]}{last_name}"
+        return None
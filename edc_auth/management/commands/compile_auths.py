@@ -0,0 +1,31 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from edc_auth.auth_plan import write_auth_plan
+
+
+class Command(BaseCommand):
+    help = (
+        "Compile the site_auths registry into a plan file that AuthUpdater "
+        "can apply without autodiscover. See settings.EDC_AUTH_PLAN_FILE"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "path",
+            nargs="?",
+            default=None,
+            help="Path of the plan file. Defaults to settings.EDC_AUTH_PLAN_FILE",
+        )
+
+    def handle(self, *args, **options):
+        path = options["path"] or getattr(settings, "EDC_AUTH_PLAN_FILE", None)
+        if not path:
+            raise CommandError("Expected a path or settings.EDC_AUTH_PLAN_FILE.")
+        plan = write_auth_plan(path)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Compiled {len(plan['registry']['groups'])} groups and "
+                f"{len(plan['registry']['roles'])} roles to {path}."
+            )
+        )
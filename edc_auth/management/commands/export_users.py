@@ -9,6 +9,14 @@ class Command(BaseCommand):
     def add_arguments(self, parser):
         parser.add_argument("--csvfile", default=None, dest="csvfile", help="CSV filename")
 
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=500,
+            dest="chunk_size",
+            help="Number of users to read from the database at a time",
+        )
+
         parser.add_argument(
             "--verbose",
             default=False,
@@ -26,4 +34,8 @@ class Command(BaseCommand):
         )
 
     def handle(self, *args, **options):
-        export_users(options["csvfile"])
+        stats = export_users(options["csvfile"], chunk_size=options["chunk_size"])
+        self.stdout.write(
+            f"Exported {stats['rows']} users in {stats['seconds']:.2f}s "
+            f"({stats['rows_per_second']:.0f} rows/s, {stats['queries']} queries)."
+        )
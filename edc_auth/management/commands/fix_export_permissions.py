@@ -4,6 +4,15 @@ from edc_auth.fix_export_permissions import ExportPermissionsFixer
 
 
 class Command(BaseCommand):
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            dest="dry_run",
+            default=False,
+            help="Print the planned changes without writing them",
+        )
+
     def handle(self, *args, **options):
-        fixer = ExportPermissionsFixer()
+        fixer = ExportPermissionsFixer(dry_run=options["dry_run"])
         fixer.fix()
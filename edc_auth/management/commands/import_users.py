@@ -65,6 +65,14 @@ class Command(BaseCommand):
             help="Limit import to a single username",
         )
 
+        parser.add_argument(
+            "--bulk",
+            default=False,
+            action="store_true",
+            dest="bulk",
+            help="Validate the whole file first, then import all users in one transaction",
+        )
+
     def handle(self, *args, **options):
         import_users(
             options["csvfile"],
@@ -75,4 +83,5 @@ class Command(BaseCommand):
             test_email_address=options["notify_to_test_email"],
             resend_as_new=options["resend_as_new"],
             limit_to_username=options["limit_to_username"],
+            bulk=options["bulk"],
         )
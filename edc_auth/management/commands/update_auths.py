@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+
+from edc_auth.auth_updater import AuthUpdater
+
+
+class Command(BaseCommand):
+    help = "Update groups, roles and permissions from the site_auths registry"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--force",
+            default=False,
+            action="store_true",
+            dest="force",
+            help=(
+                "Update even if the site_auths registry and permissions have not "
+                "changed since the last update"
+            ),
+        )
+
+        parser.add_argument(
+            "--warn-only",
+            default=False,
+            action="store_true",
+            dest="warn_only",
+            help="Warn instead of raise if a codename does not exist",
+        )
+
+        parser.add_argument(
+            "--dry-run",
+            default=False,
+            action="store_true",
+            dest="dry_run",
+            help="Print the planned changes without writing them",
+        )
+
+    def handle(self, *args, **options):
+        AuthUpdater(
+            verbose=True,
+            warn_only=options["warn_only"],
+            force=options["force"],
+            dry_run=options["dry_run"],
+        )
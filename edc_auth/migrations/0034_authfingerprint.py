@@ -0,0 +1,34 @@
+# Generated by Django 5.1.2 on 2026-10-18 08:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("edc_auth", "0033_alter_userprofile_is_multisite_viewer"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="AuthFingerprint",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(default="default", max_length=50, unique=True)),
+                ("registry_fingerprint", models.CharField(max_length=64)),
+                ("permissions_fingerprint", models.CharField(max_length=64)),
+                ("modified", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "verbose_name": "Auth fingerprint",
+                "verbose_name_plural": "Auth fingerprints",
+            },
+        ),
+    ]
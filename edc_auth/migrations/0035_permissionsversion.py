@@ -0,0 +1,32 @@
+# Generated by Django 5.1.2 on 2026-10-18 10:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("edc_auth", "0034_authfingerprint"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PermissionsVersion",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("key", models.CharField(max_length=100, unique=True)),
+                ("version", models.PositiveBigIntegerField(default=0)),
+            ],
+            options={
+                "verbose_name": "Permissions version",
+                "verbose_name_plural": "Permissions versions",
+            },
+        ),
+    ]
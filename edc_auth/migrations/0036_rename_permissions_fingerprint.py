@@ -0,0 +1,17 @@
+# Generated by Django 5.1.2 on 2026-10-18 14:40
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("edc_auth", "0035_permissionsversion"),
+    ]
+
+    operations = [
+        migrations.RenameField(
+            model_name="authfingerprint",
+            old_name="permissions_fingerprint",
+            new_name="database_fingerprint",
+        ),
+    ]
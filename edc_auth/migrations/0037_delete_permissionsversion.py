@@ -0,0 +1,15 @@
+# Generated by Django 5.1.2 on 2026-10-18 15:20
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("edc_auth", "0036_rename_permissions_fingerprint"),
+    ]
+
+    operations = [
+        migrations.DeleteModel(
+            name="PermissionsVersion",
+        ),
+    ]
@@ -2,9 +2,13 @@ import sys
 
 from django.conf import settings
 
+from .auth_fingerprint import AuthFingerprint
 from .edc_permissions import EdcPermissions
 from .role import Role
 from .signals import (
+    update_permissions_cache_on_m2m_changed,
+    update_permissions_cache_on_post_delete,
+    update_permissions_cache_on_role_post_save,
     update_user_groups_on_role_m2m_changed,
     update_user_profile_on_post_save,
 )
@@ -0,0 +1,25 @@
+from django.db import models
+
+
+class AuthFingerprint(models.Model):
+    """Fingerprints of the `site_auths` registry and of the
+    permission, group and role tables and their through tables from
+    the last completed `AuthUpdater` run.
+
+    See `AuthUpdater` and `get_database_fingerprint`.
+    """
+
+    name = models.CharField(max_length=50, unique=True, default="default")
+
+    registry_fingerprint = models.CharField(max_length=64)
+
+    database_fingerprint = models.CharField(max_length=64)
+
+    modified = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.name
+
+    class Meta:
+        verbose_name = "Auth fingerprint"
+        verbose_name_plural = "Auth fingerprints"
@@ -1,18 +1,35 @@
-from django.contrib.auth.models import User
+from django.contrib.auth.models import Group, Permission, User
 from django.core.exceptions import ObjectDoesNotExist
-from django.db.models.signals import m2m_changed, post_save
+from django.db.models.signals import m2m_changed, post_delete, post_save
 from django.dispatch import receiver
 
+from ..deferred_role_updates import deferred_role_updates
+from ..permissions_cache import bump_permissions_cache_version
+from .role import Role
 from .user_profile import UserProfile
 
+# User fields the cached permissions depend on, see `get_cache_key`
+PERMISSION_FIELDS = {"is_active", "is_superuser", "is_staff"}
+
 
 @receiver(post_save, weak=False, sender=User, dispatch_uid="update_user_profile_on_post_save")
-def update_user_profile_on_post_save(sender, instance, raw, **kwargs):
+def update_user_profile_on_post_save(
+    sender, instance, raw, created=False, update_fields=None, **kwargs
+):
+    """Creates the user profile, if missing, and invalidates cached
+    permissions if the user is created or a permission relevant
+    field is saved.
+
+    These fields are also part of the cache key, so other saves do
+    not invalidate, see `get_cache_key`.
+    """
     if not raw:
         try:
             instance.userprofile
         except ObjectDoesNotExist:
             UserProfile.objects.create(user=instance)
+        if created or set(update_fields or []) & PERMISSION_FIELDS:
+            bump_permissions_cache_version(user_id=instance.id)
 
 
 @receiver(m2m_changed, weak=False, dispatch_uid="update_user_groups_on_role_m2m_changed")
@@ -23,7 +40,58 @@ def update_user_groups_on_role_m2m_changed(sender, action, instance, pk_set, **k
         pass
     else:
         if through == sender and action in ["post_add", "post_remove"]:
-            if action == "post_add":
+            deferred = deferred_role_updates.get()
+            if deferred is not None:
+                deferred.collect(instance, action, pk_set)
+            elif action == "post_add":
                 instance.add_groups_for_roles(pk_set)
             elif action == "post_remove":
                 instance.remove_groups_for_roles(pk_set)
+
+
+@receiver(m2m_changed, weak=False, dispatch_uid="update_permissions_cache_on_m2m_changed")
+def update_permissions_cache_on_m2m_changed(sender, action, instance, **kwargs):
+    """Invalidates cached permissions and sites if a user's groups,
+    permissions, roles or sites change or if a group's permissions
+    or a role's groups change.
+    """
+    if action in ["post_add", "post_remove", "post_clear"]:
+        if sender in [User.groups.through, User.user_permissions.through]:
+            if isinstance(instance, User):
+                bump_permissions_cache_version(user_id=instance.id)
+            else:
+                bump_permissions_cache_version()
+        elif sender in [UserProfile.roles.through, UserProfile.sites.through]:
+            if isinstance(instance, UserProfile):
+                bump_permissions_cache_version(user_id=instance.user_id)
+            else:
+                bump_permissions_cache_version()
+        elif sender in [Group.permissions.through, Role.groups.through]:
+            bump_permissions_cache_version()
+
+
+@receiver(
+    post_save,
+    weak=False,
+    sender=Role,
+    dispatch_uid="update_permissions_cache_on_role_post_save",
+)
+def update_permissions_cache_on_role_post_save(sender, instance, raw, **kwargs):
+    """Invalidates `auth_closure` if a role is added or renamed."""
+    if not raw:
+        bump_permissions_cache_version()
+
+
+@receiver(
+    post_delete,
+    weak=False,
+    dispatch_uid="update_permissions_cache_on_post_delete",
+)
+def update_permissions_cache_on_post_delete(sender, instance, **kwargs):
+    """Invalidates cached permissions, sites and `auth_closure` if a
+    group, role or permission is deleted.
+
+    Cascade deletes of m2m rows do not send `m2m_changed`.
+    """
+    if sender in [Group, Role, Permission]:
+        bump_permissions_cache_version()
@@ -1,4 +1,4 @@
-from django.contrib.auth.models import Group, User
+from django.contrib.auth.models import User
 from django.contrib.sites.models import Site
 from django.core.validators import RegexValidator
 from django.db import models
@@ -96,16 +96,14 @@ class UserProfile(NotificationUserProfileModelMixin, models.Model):
 
         Called by m2m signal.
         """
-        if CUSTOM_ROLE not in [obj.name for obj in self.roles.all()]:
-            group_names = [group.name for group in self.user.groups.all()]
-            add_group_names = []
-            for role in self.roles.all():
-                for group in role.groups.all():
-                    if group.name not in group_names:
-                        add_group_names.append(group.name)
-            add_group_names = list(set(add_group_names))
-            for name in add_group_names:
-                self.user.groups.add(Group.objects.get(name=name))
+        if not self.roles.filter(name=CUSTOM_ROLE).exists():
+            group_ids = set(
+                Role.groups.through.objects.filter(role__in=self.roles.all())
+                .exclude(group_id__in=self.user.groups.values("id"))
+                .values_list("group_id", flat=True)
+            )
+            if group_ids:
+                self.user.groups.add(*group_ids)
                 self.user.save()
 
     def remove_groups_for_roles(self, pk_set):
@@ -113,25 +111,23 @@ class UserProfile(NotificationUserProfileModelMixin, models.Model):
 
         Called by m2m signal.
         """
-        if CUSTOM_ROLE in [obj.name for obj in Role.objects.filter(pk__in=pk_set)]:
+        if Role.objects.filter(pk__in=pk_set, name=CUSTOM_ROLE).exists():
             self.user.groups.clear()
             self.user.userprofile.roles.clear()
             self.user.userprofile.roles.add(Role.objects.get(name=STAFF_ROLE))
         else:
-            remove_group_names = []
-            current_group_names = []
-            for role in self.roles.all():
-                current_group_names.extend([group.name for group in role.groups.all()])
-            for role in Role.objects.filter(pk__in=pk_set):
-                remove_group_names.extend(
-                    [
-                        group.name
-                        for group in role.groups.all()
-                        if group.name not in current_group_names
-                    ]
+            role_group_model_cls = Role.groups.through
+            group_ids = set(
+                role_group_model_cls.objects.filter(role_id__in=pk_set)
+                .exclude(
+                    group_id__in=role_group_model_cls.objects.filter(
+                        role__in=self.roles.all()
+                    ).values("group_id")
                 )
-            for name in remove_group_names:
-                self.user.groups.remove(Group.objects.get(name=name))
+                .values_list("group_id", flat=True)
+            )
+            if group_ids:
+                self.user.groups.remove(*group_ids)
 
     class Meta(NotificationUserProfileModelMixin.Meta):
         verbose_name = _("User profile")
@@ -0,0 +1,101 @@
+from __future__ import annotations
+
+import time
+from typing import TYPE_CHECKING, Callable
+
+from django.conf import settings
+from django.core.cache import caches
+
+if TYPE_CHECKING:
+    from django.core.cache.backends.base import BaseCache
+
+VERSION_KEY = "edc_auth:permissions:version"
+
+
+def get_permissions_cache() -> BaseCache:
+    """Returns the cache for resolved user permissions and sites.
+
+    See settings.EDC_AUTH_PERMISSIONS_CACHE, default is "default".
+    """
+    return caches[getattr(settings, "EDC_AUTH_PERMISSIONS_CACHE", "default")]
+
+
+def get_permissions_cache_timeout() -> int | None:
+    return getattr(settings, "EDC_AUTH_PERMISSIONS_CACHE_TIMEOUT", 300)
+
+
+def get_user_version_key(user_id: int) -> str:
+    return f"{VERSION_KEY}:{user_id}"
+
+
+def get_initial_version() -> int:
+    """Returns a new starting value for a missing version counter.
+
+    Time based, so a counter evicted from the cache does not start
+    again at a value used by a stale cache entry.
+    """
+    return time.time_ns()
+
+
+def get_versions(*keys: str) -> dict[str, int]:
+    """Returns a dict of {key: version} for the given keys.
+
+    Version counters are kept, without a timeout, in the permissions
+    cache. A missing counter is added, see `get_initial_version`.
+    """
+    cache = get_permissions_cache()
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, get_initial_version(), None)
+            versions[key] = cache.get(key, get_initial_version())
+    return versions
+
+
+def get_permissions_version() -> int:
+    """Returns the global version counter."""
+    return get_versions(VERSION_KEY)[VERSION_KEY]
+
+
+def bump_permissions_cache_version(user_id: int | None = None) -> None:
+    """Invalidates cached permissions for one user or, if `user_id`
+    is None, for all users.
+    """
+    cache = get_permissions_cache()
+    key = VERSION_KEY if user_id is None else get_user_version_key(user_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, get_initial_version(), None):
+            cache.incr(key)
+
+
+def get_cache_key(user) -> str:
+    """Returns the cache key for the user's data using the global
+    and user version counters and the user's `is_active`,
+    `is_superuser` and `is_staff` flags.
+    """
+    user_version_key = get_user_version_key(user.id)
+    versions = get_versions(VERSION_KEY, user_version_key)
+    flags = "".join(
+        str(int(bool(getattr(user, attr, False))))
+        for attr in ["is_active", "is_superuser", "is_staff"]
+    )
+    return (
+        f"edc_auth:permissions:{user.id}:{flags}:"
+        f"{versions[VERSION_KEY]}:{versions[user_version_key]}"
+    )
+
+
+def get_cached_user_data(user, loader: Callable[[], dict]) -> dict:
+    """Returns a dict of resolved data for the user from the cache.
+
+    If not in the cache, the data is loaded using `loader` and cached.
+    """
+    cache = get_permissions_cache()
+    key = get_cache_key(user)
+    data = cache.get(key)
+    if data is None:
+        data = loader()
+        cache.set(key, data, get_permissions_cache_timeout())
+    return data
@@ -1,16 +1,25 @@
 from __future__ import annotations
 
+import json
 import sys
+from contextlib import contextmanager
+from contextvars import ContextVar
 from copy import deepcopy
-from typing import Callable, Tuple
+from functools import lru_cache
+from hashlib import sha256
+from typing import Any, Callable, Iterator, NamedTuple, Tuple
 from warnings import warn
 
 from django.apps import apps as django_apps
 from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
 from django.utils.module_loading import import_module, module_has_submodule
 
 from .auth_objects import default_groups, default_pii_models, default_roles
 
+MISSING = object()
+
 
 class AlreadyRegistered(Exception):
     pass
@@ -40,48 +49,287 @@ class SiteAuthError(Exception):
     pass
 
 
+class ParsedCodename(NamedTuple):
+    app_label: str
+    action: str
+    model: str
+    is_historical: bool
+    is_view: bool
+
+
+@lru_cache(maxsize=None)
+def parse_codename(codename: str) -> ParsedCodename:
+    """Returns the parts of a dotted codename,
+    '<app_label>.<action>_<model>'.
+
+    Memoized, each codename is parsed once.
+
+    `is_view` includes `edc_navbar`, 'nav_' and `edc_dashboard`
+    codenames.
+    """
+    app_label, _, name = codename.partition(".")
+    action, _, model = name.partition("_")
+    return ParsedCodename(
+        app_label=app_label,
+        action=action,
+        model=model,
+        is_historical=model.startswith("historical"),
+        is_view=(
+            "view_" in codename
+            or "nav_" in codename
+            or "navbar" in codename
+            or "dashboard" in codename
+        ),
+    )
+
+
+@lru_cache(maxsize=None)
+def get_model_labels() -> frozenset[str]:
+    """Returns the `label_lower` of every installed model.
+
+    Memoized. Cleared when `site_auths` is reset or rolled back and
+    when settings.INSTALLED_APPS changes.
+    """
+    return frozenset(
+        model_cls._meta.label_lower
+        for model_cls in django_apps.get_models(include_auto_created=True)
+    )
+
+
+@receiver(setting_changed, dispatch_uid="edc_auth_clear_model_labels_on_setting_changed")
+def clear_model_labels_on_setting_changed(setting, **kwargs):
+    if setting == "INSTALLED_APPS":
+        get_model_labels.cache_clear()
+
+
 def is_view_codename(codename):
-    return (
-        "view_" in codename
-        or "view_historical" in codename
-        or "nav_" in codename
-        or "navbar" in codename
-        or "dashboard" in codename
+    return parse_codename(codename).is_view
+
+
+# callable -> tuple of codenames, set by `codename_expansion`
+expansion_memo: ContextVar[dict | None] = ContextVar("expansion_memo", default=None)
+
+
+@contextmanager
+def codename_expansion() -> Iterator[dict]:
+    """Within this context, each callable codename provider is called
+    once and the result is reused, see `call_codenames_func`.
+
+    Yields the memo of {callable: tuple of codenames}.
+    """
+    memo = expansion_memo.get()
+    if memo is not None:
+        yield memo
+    else:
+        token = expansion_memo.set({})
+        try:
+            yield expansion_memo.get()
+        finally:
+            expansion_memo.reset(token)
+
+
+def call_codenames_func(func: Callable) -> tuple[str, ...]:
+    """Returns the codenames from a callable codename provider.
+
+    Memoized if called within `codename_expansion`.
+    """
+    memo = expansion_memo.get()
+    if memo is None:
+        return tuple(func())
+    if func not in memo:
+        memo[func] = tuple(func())
+    return memo[func]
+
+
+def expand_codenames(codenames_or_callables: list[Any]) -> list[str]:
+    """Returns a list of codenames where callables are replaced by
+    the codenames they return.
+    """
+    codenames = []
+    for item in codenames_or_callables or []:
+        if callable(item):
+            codenames.extend(call_codenames_func(item))
+        else:
+            codenames.append(item)
+    return codenames
+
+
+def expand_groups(groups: dict) -> dict[str, tuple[str, ...]]:
+    """Returns a dict of {group name: sorted tuple of unique codenames}.
+
+    Each callable is called once, see `codename_expansion`.
+    """
+    with codename_expansion():
+        return {
+            name: tuple(sorted(set(expand_codenames(codenames))))
+            for name, codenames in groups.items()
+        }
+
+
+class RegistrySnapshot(NamedTuple):
+    """An immutable, fully expanded and sorted copy of the registry
+    data used by `AuthUpdater`, see `SiteAuths.snapshot`.
+
+    `hash` is a sha256 of all other fields.
+    """
+
+    version: str | None
+    groups: tuple[tuple[str, tuple[str, ...]], ...]
+    roles: tuple[tuple[str, tuple[str, ...]], ...]
+    pii_models: tuple[str, ...]
+    custom_permissions_tuples: tuple[tuple[str, tuple[tuple[str, str], ...]], ...]
+    view_only_prefixes: tuple[str, ...]
+    pre_update_funcs: tuple[str, ...]
+    post_update_funcs: tuple[tuple[str, str], ...]
+    hash: str
+
+    def as_dict(self) -> dict:
+        """Returns the snapshot, without `hash`, as JSON serializable
+        data.
+        """
+        return dict(
+            version=self.version,
+            groups={name: list(codenames) for name, codenames in self.groups},
+            roles={name: list(group_names) for name, group_names in self.roles},
+            pii_models=list(self.pii_models),
+            custom_permissions_tuples={
+                model: [list(tpl) for tpl in codename_tuples]
+                for model, codename_tuples in self.custom_permissions_tuples
+            },
+            view_only_prefixes=list(self.view_only_prefixes),
+            pre_update_funcs=list(self.pre_update_funcs),
+            post_update_funcs=[list(item) for item in self.post_update_funcs],
+        )
+
+
+def get_func_path(func: Callable | str) -> str:
+    """Returns the import path of a function, or `func` if already
+    a path.
+    """
+    if isinstance(func, str):
+        return func
+    return f"{func.__module__}.{func.__qualname__}"
+
+
+def get_registry_snapshot(
+    groups: dict | None = None,
+    roles: dict | None = None,
+    pii_models: list | None = None,
+    custom_permissions_tuples: dict | None = None,
+    view_only_prefixes: list | None = None,
+    version: str | None = None,
+    pre_update_funcs: list | None = None,
+    post_update_funcs: list | None = None,
+) -> RegistrySnapshot:
+    """Returns a `RegistrySnapshot` of the given registry data.
+
+    Callables in `groups` are expanded, see `expand_groups`. Pre and
+    post update funcs are kept, in order, as import paths.
+    """
+    snapshot = RegistrySnapshot(
+        version=version,
+        groups=tuple(sorted(expand_groups(groups or {}).items())),
+        roles=tuple(
+            sorted(
+                (name, tuple(sorted(set(group_names))))
+                for name, group_names in (roles or {}).items()
+            )
+        ),
+        pii_models=tuple(sorted(pii_models or [])),
+        custom_permissions_tuples=tuple(
+            sorted(
+                (model, tuple(sorted(tuple(tpl) for tpl in codename_tuples)))
+                for model, codename_tuples in (custom_permissions_tuples or {}).items()
+            )
+        ),
+        view_only_prefixes=tuple(sorted(view_only_prefixes or [])),
+        pre_update_funcs=tuple(get_func_path(func) for func in pre_update_funcs or []),
+        post_update_funcs=tuple(
+            (app_label, get_func_path(func)) for app_label, func in post_update_funcs or []
+        ),
+        hash="",
+    )
+    return snapshot._replace(
+        hash=sha256(json.dumps(snapshot.as_dict(), sort_keys=True).encode()).hexdigest()
     )
 
 
+def diff_registry_snapshots(a: RegistrySnapshot, b: RegistrySnapshot) -> dict:
+    """Returns the changes from snapshot `a` to snapshot `b`.
+
+    Sections and names without changes are left out. An empty dict
+    means the snapshots are equivalent.
+
+        * version: (old, new)
+        * groups, roles, pii_models, view_only_prefixes,
+          pre_update_funcs, post_update_funcs: (added, removed)
+        * codenames: {group name: (added, removed)}
+        * role_groups: {role name: (added, removed)}
+        * custom_permissions_tuples: {model: (added, removed)}
+    """
+
+    def added_removed(old, new) -> tuple[tuple, tuple]:
+        return tuple(sorted(set(new) - set(old))), tuple(sorted(set(old) - set(new)))
+
+    diff = {}
+    if a.hash == b.hash:
+        return diff
+    if a.version != b.version:
+        diff["version"] = (a.version, b.version)
+    for key in ["groups", "roles"]:
+        changes = added_removed(dict(getattr(a, key)), dict(getattr(b, key)))
+        if any(changes):
+            diff[key] = changes
+    for key, section in [
+        ("codenames", "groups"),
+        ("role_groups", "roles"),
+        ("custom_permissions_tuples", "custom_permissions_tuples"),
+    ]:
+        old, new = dict(getattr(a, section)), dict(getattr(b, section))
+        changes = {
+            name: added_removed(old.get(name, ()), new.get(name, ()))
+            for name in sorted(set(old) | set(new))
+        }
+        changes = {name: value for name, value in changes.items() if any(value)}
+        if changes:
+            diff[key] = changes
+    for key in [
+        "pii_models",
+        "view_only_prefixes",
+        "pre_update_funcs",
+        "post_update_funcs",
+    ]:
+        changes = added_removed(getattr(a, key), getattr(b, key))
+        if any(changes):
+            diff[key] = changes
+    return diff
+
+
 def view_only_wrapper(func):
-    codenames = func()
+    codenames = call_codenames_func(func)
     return [codename for codename in codenames if is_view_codename(codename)]
 
 
 def convert_view_to_export_wrapper(codename_or_callables):
-    codenames = []
     export_codenames = []
-    for codename in codename_or_callables:
-        try:
-            codenames.extend(codename())
-        except TypeError:
-            codenames.append(codename)
-    for codename in codenames:
-        if is_view_codename(codename) and "historical" not in codename:
-            try:
-                django_apps.get_model(codename.replace("view_", ""))
-            except LookupError:
-                pass
-            else:
-                export_codenames.append(codename.replace("view_", "export_"))
+    model_labels = get_model_labels()
+    for codename in expand_codenames(codename_or_callables):
+        parsed = parse_codename(codename)
+        if (
+            parsed.action == "view"
+            and not parsed.is_historical
+            and f"{parsed.app_label}.{parsed.model}" in model_labels
+        ):
+            export_codenames.append(f"{parsed.app_label}.export_{parsed.model}")
     return export_codenames
 
 
 def remove_delete_wrapper(codename_or_callables):
-    codenames = []
-    for codename in codename_or_callables:
-        try:
-            codenames.extend(codename())
-        except TypeError:
-            codenames.append(codename)
-    return [c for c in codenames if "delete_" not in c]
+    return [
+        c
+        for c in expand_codenames(codename_or_callables)
+        if parse_codename(c).action != "delete"
+    ]
 
 
 class SiteAuths:
@@ -92,9 +340,13 @@ class SiteAuths:
 
     def __init__(self):
         self.registry = {}
+        self.journal: list[tuple] | None = None
+        self.dirty = False
         self.initialize()
 
     def initialize(self):
+        get_model_labels.cache_clear()
+        self.dirty = False
         self.registry = {
             "groups": default_groups,
             "roles": default_roles,
@@ -104,9 +356,12 @@ class SiteAuths:
             "pre_update_funcs": [],
             "post_update_funcs": [],
             "pii_models": default_pii_models,
+            "view_only_prefixes": [],
         }
 
     def clear(self):
+        get_model_labels.cache_clear()
+        self.dirty = False
         self.registry = {
             "groups": {},
             "roles": {},
@@ -116,10 +371,13 @@ class SiteAuths:
             "pre_update_funcs": [],
             "post_update_funcs": [],
             "pii_models": [],
+            "view_only_prefixes": [],
         }
 
     def clear_values(self):
+        get_model_labels.cache_clear()
         registry = deepcopy(self.registry)
+        self.dirty = False
         self.registry = {
             "groups": {k: [] for k in registry.get("groups")},
             "roles": {k: [] for k in self.registry.get("roles")},
@@ -129,23 +387,76 @@ class SiteAuths:
             "pre_update_funcs": [],
             "post_update_funcs": [],
             "pii_models": [],
+            "view_only_prefixes": [],
         }
 
+    @contextmanager
+    def journaled(self) -> Iterator[list[tuple]]:
+        """Records mutations made through the `add_*` and `update_*`
+        methods and undoes them if the block raises.
+
+        Used by `autodiscover` instead of a copy of the registry per
+        app. Changes made directly to `registry` are not recorded.
+        """
+        self.journal = []
+        try:
+            yield self.journal
+        except BaseException:
+            self.rollback(self.journal)
+            raise
+        finally:
+            self.journal = None
+
+    def record(self, key: str, name: str | None = None) -> None:
+        """Records the current value of `registry[key]`, or of
+        `registry[key][name]`, if journaling.
+        """
+        if self.journal is not None:
+            if name is None:
+                self.journal.append((key, None, len(self.registry[key])))
+            else:
+                value = self.registry[key].get(name, MISSING)
+                if isinstance(value, list):
+                    value = list(value)
+                self.journal.append((key, name, value))
+
+    def rollback(self, journal: list[tuple]) -> None:
+        """Undoes the recorded mutations, newest first."""
+        get_model_labels.cache_clear()
+        for key, name, value in reversed(journal):
+            if name is None:
+                del self.registry[key][value:]
+            elif value is MISSING:
+                self.registry[key].pop(name, None)
+            else:
+                self.registry[key][name] = value
+
     @property
     def edc_auth_skip_site_auths(self):
         return getattr(settings, "EDC_AUTH_SKIP_SITE_AUTHS", False)
 
     def add_pre_update_func(self, func):
+        self.record("pre_update_funcs")
         self.registry["pre_update_funcs"].append(func)
 
     def add_post_update_func(self, app_label: str, func: Callable):
+        self.record("post_update_funcs")
         self.registry["post_update_funcs"].append((app_label, func))
 
     def add_pii_model(self, model_name):
         if model_name in self.registry["pii_models"]:
             raise PiiModelAlreadyExists(f"PII model already exists. Got {model_name}")
+        self.record("pii_models")
         self.registry["pii_models"].append(model_name)
 
+    def add_view_only_prefix(self, prefix: str):
+        """Adds a prefix for codenames limited to `view` in all groups,
+        see `GroupUpdater.view_only_prefixes`.
+        """
+        if prefix not in self.registry["view_only_prefixes"]:
+            self.record("view_only_prefixes")
+            self.registry["view_only_prefixes"].append(prefix)
+
     def add_groups(self, data: dict):
         for name, codenames in data.items():
             self.add_group(codenames, name=name)
@@ -170,13 +481,19 @@ class SiteAuths:
             codenames_or_func = self.get_view_only_codenames(codenames_or_func)
         if convert_to_export:
             codenames_or_func = self.convert_to_export_codenames(codenames_or_func)
+        self.record("groups", name)
         self.registry["groups"].update({name: codenames_or_func})
+        if name in self.registry["update_groups"]:
+            self.dirty = True
 
     def add_role(self, *group_names, name=None):
         if name in self.registry["roles"]:
             raise RoleAlreadyExists(f"Role name already exists. Got {name}.")
-        group_names = list(set(group_names))
+        group_names = list(dict.fromkeys(group_names))
+        self.record("roles", name)
         self.registry["roles"].update({name: group_names})
+        if name in self.registry["update_roles"]:
+            self.dirty = True
 
     def update_group(
         self, *codenames_or_func, name=None, key=None, view_only=None, no_delete=None
@@ -186,28 +503,33 @@ class SiteAuths:
             codenames_or_func = self.remove_delete_codenames(codenames_or_func)
         if view_only:
             codenames_or_func = self.get_view_only_codenames(codenames_or_func)
-        codenames_or_func = list(set(codenames_or_func))
-        existing_codenames = deepcopy(self.registry[key].get(name)) or []
-        try:
-            existing_codenames = list(set(existing_codenames))
-        except TypeError as e:
-            raise TypeError(f"{e}. Got {name}")
-        existing_codenames.extend(codenames_or_func)
-        existing_codenames = list(set(existing_codenames))
-        self.registry[key].update({name: existing_codenames})
+        self.merge(key, name, codenames_or_func)
 
     def update_role(self, *group_names, name=None, key=None) -> None:
         key = key or "update_roles"
-        group_names = list(set(group_names))
-        existing_group_names = deepcopy(self.registry[key].get(name)) or []
-        existing_group_names = list(set(existing_group_names))
-        existing_group_names.extend(group_names)
-        existing_group_names = list(set(existing_group_names))
-        self.registry[key].update({name: existing_group_names})
+        self.merge(key, name, group_names)
+
+    def merge(self, key: str, name: str, values) -> None:
+        """Appends `values` not already in `registry[key][name]`,
+        keeping the order in which they were first added.
+
+        Changes to `update_groups` or `update_roles` mark the registry
+        as dirty, see `populate`.
+        """
+        existing = self.registry[key].get(name) or []
+        try:
+            merged = list(dict.fromkeys([*existing, *values]))
+        except TypeError as e:
+            raise TypeError(f"{e}. Got {name}")
+        self.record(key, name)
+        self.registry[key].update({name: merged})
+        if key in ["update_groups", "update_roles"]:
+            self.dirty = True
 
     def add_custom_permissions_tuples(
         self, model: str, codename_tuples: Tuple[Tuple[str, str], ...]
     ):
+        self.record("custom_permissions_tuples", model)
         try:
             self.registry["custom_permissions_tuples"][model]
         except KeyError:
@@ -263,16 +585,22 @@ class SiteAuths:
 
     @property
     def roles(self):
+        self.populate()
         return self.registry["roles"]
 
     @property
     def groups(self):
+        self.populate()
         return self.registry["groups"]
 
     @property
     def pii_models(self):
         return self.registry["pii_models"]
 
+    @property
+    def view_only_prefixes(self):
+        return self.registry["view_only_prefixes"]
+
     @property
     def pre_update_funcs(self):
         return self.registry["pre_update_funcs"]
@@ -285,14 +613,44 @@ class SiteAuths:
     def custom_permissions_tuples(self):
         return self.registry["custom_permissions_tuples"]
 
+    def snapshot(self, version: str | None = None) -> RegistrySnapshot:
+        """Returns a hashable, fully expanded `RegistrySnapshot` of
+        the registry. Does not touch the database.
+        """
+        return get_registry_snapshot(
+            groups=self.groups,
+            roles=self.roles,
+            pii_models=self.pii_models,
+            custom_permissions_tuples=self.custom_permissions_tuples,
+            view_only_prefixes=self.view_only_prefixes,
+            version=version,
+            pre_update_funcs=self.pre_update_funcs,
+            post_update_funcs=self.post_update_funcs,
+        )
+
+    @staticmethod
+    def diff(a: RegistrySnapshot, b: RegistrySnapshot) -> dict:
+        """Returns the registry data added or removed from snapshot
+        `a` to snapshot `b`, see `diff_registry_snapshots`.
+        """
+        return diff_registry_snapshots(a, b)
+
+    def get_expanded_groups(self) -> dict[str, tuple[str, ...]]:
+        """Returns the groups with all callables expanded.
+
+        For debugging. `AuthUpdater` expands the groups once per run,
+        see `AuthUpdater.expanded_groups`.
+        """
+        return expand_groups(self.groups)
+
     def verify_and_populate(
         self, app_name: str | None = None, warn_only: bool | None = None
     ) -> None:
         """Verifies that updates refer to existing group
-        or roles names.
+        or roles names, then populates, see `populate`.
 
-        * Updates data from `update_groups` -> `groups`
-        * Updates data from `update_roles` -> `roles`
+        If `warn_only`, an update to an unknown group or role
+        adds it.
         """
         for name, codenames in self.registry["update_groups"].items():
             if name not in self.registry["groups"]:
@@ -304,7 +662,7 @@ class SiteAuths:
                     warn(msg)
                 else:
                     raise InvalidGroup(msg)
-            self.update_group(*codenames, name=name, key="groups")
+                self.merge("groups", name, codenames)
         for name, group_names in self.registry["update_roles"].items():
             if name not in self.registry["roles"]:
                 msg = (
@@ -315,12 +673,35 @@ class SiteAuths:
                     warn(msg)
                 else:
                     raise InvalidRole(msg)
-            self.update_role(*group_names, name=name, key="roles")
+                self.merge("roles", name, group_names)
+        self.populate()
+
+    def populate(self) -> None:
+        """Updates, without validating:
+
+        * `groups` with data from `update_groups`
+        * `roles` with data from `update_roles`
+
+        Updates to a group or role not yet added are skipped until
+        it is added. Does nothing unless an update, or a group or role
+        with a pending update, was added since the last call. Called on
+        access of `groups` or `roles`.
+        """
+        if not self.dirty:
+            return
+        for key in ["groups", "roles"]:
+            for name, values in self.registry[f"update_{key}"].items():
+                if name in self.registry[key]:
+                    self.merge(key, name, values)
+        self.dirty = False
 
     def autodiscover(self, module_name=None, verbose=True):
-        """Autodiscovers in the auths.py file of any INSTALLED_APP."""
+        """Autodiscovers in the auths.py file of any INSTALLED_APP.
+
+        If importing an `auths` module fails, only the changes made
+        by that module are undone, see `journaled`.
+        """
         if not self.edc_auth_skip_site_auths:
-            before_import_registry = None
             module_name = module_name or "auths"
             writer = sys.stdout.write if verbose else lambda x: x
             writer(f" * checking for site {module_name} ...\n")
@@ -328,16 +709,16 @@ class SiteAuths:
                 writer(f" * searching {app_name}           \r")
                 try:
                     mod = import_module(app_name)
-                    try:
-                        before_import_registry = deepcopy(site_auths.registry)
-                        import_module(f"{app_name}.{module_name}")
-                        writer(f"   - registered '{module_name}' from '{app_name}'\n")
-                    except ImportError as e:
-                        site_auths.registry = before_import_registry
-                        if module_has_submodule(mod, module_name):
-                            raise SiteAuthError(str(e))
                 except ImportError:
-                    pass
+                    continue
+                if not module_has_submodule(mod, module_name):
+                    continue
+                try:
+                    with self.journaled():
+                        import_module(f"{app_name}.{module_name}")
+                except ImportError as e:
+                    raise SiteAuthError(str(e))
+                writer(f"   - registered '{module_name}' from '{app_name}'\n")
             self.verify_and_populate(app_name=app_name)
 
 
@@ -1,6 +1,8 @@
 import os
 
 from django.conf import settings
+from django.core.cache import InvalidCacheBackendError, caches
+from django.core.cache.backends.dummy import DummyCache
 from django.core.checks import CheckMessage, Warning
 from django.core.management import color_style
 
@@ -105,3 +107,23 @@ def check_site_auths(app_configs, **kwargs) -> list[CheckMessage]:
                 )
             )
     return errors
+
+
+def check_permissions_cache(app_configs, **kwargs) -> list[CheckMessage]:
+    errors = []
+    alias = getattr(settings, "EDC_AUTH_PERMISSIONS_CACHE", "default")
+    try:
+        cache = caches[alias]
+    except InvalidCacheBackendError:
+        pass
+    else:
+        if isinstance(cache, DummyCache):
+            errors.append(
+                Warning(
+                    f"Permissions cache `{alias}` is a DummyCache. User permissions "
+                    "and sites are loaded from the database on every lookup. "
+                    "See settings.EDC_AUTH_PERMISSIONS_CACHE.",
+                    id="settings.EDC_AUTH_PERMISSIONS_CACHE",
+                )
+            )
+    return errors
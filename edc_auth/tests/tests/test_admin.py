@@ -0,0 +1,86 @@
+from django.contrib.auth.models import Group, Permission, User
+from django.contrib.sites.models import Site
+from django.db import connection
+from django.test import override_settings
+from django.test.client import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from edc_sites.models import SiteProfile
+
+from edc_auth.admin_site import edc_auth_admin
+from edc_auth.auth_updater import AuthUpdater
+from edc_auth.constants import CLINICIAN_ROLE, STAFF_ROLE
+from edc_auth.models import Role, UserProfile
+
+from ..utils import EdcAuthTestCase, create_users
+
+
+@override_settings(
+    EDC_AUTH_SKIP_SITE_AUTHS=False,
+    EDC_AUTH_SKIP_AUTH_UPDATER=False,
+)
+class TestAdmin(EdcAuthTestCase):
+    def setUp(self):
+        AuthUpdater(verbose=False)
+        self.request = RequestFactory().get("/")
+        self.request.user = User.objects.create(username="erik", is_superuser=True)
+        for site in Site.objects.all():
+            SiteProfile.objects.create(site=site, country="botswana")
+
+    def render_changelist_columns(self, model_cls, columns) -> int:
+        """Returns the number of queries to fetch the changelist
+        queryset and render `columns` for every row.
+        """
+        model_admin = edc_auth_admin._registry[model_cls]
+        with CaptureQueriesContext(connection) as ctx:
+            for obj in model_admin.get_queryset(self.request):
+                for column in columns:
+                    getattr(model_admin, column)(obj)
+        return len(ctx.captured_queries)
+
+    def test_user_admin_columns(self):
+        create_users(count=3)
+        for user in User.objects.exclude(username="erik"):
+            user.userprofile.roles.add(
+                Role.objects.get(name=CLINICIAN_ROLE), Role.objects.get(name=STAFF_ROLE)
+            )
+            user.userprofile.sites.add(*Site.objects.all())
+        columns = ["role", "sites", "multisite_viewer"]
+        num_queries = self.render_changelist_columns(User, columns)
+        create_users(count=10)
+        for user in User.objects.exclude(username="erik"):
+            user.userprofile.roles.add(Role.objects.get(name=CLINICIAN_ROLE))
+            user.userprofile.sites.add(*Site.objects.all())
+        self.assertEqual(self.render_changelist_columns(User, columns), num_queries)
+
+    def test_group_admin_columns(self):
+        num_queries = self.render_changelist_columns(Group, ["codenames"])
+        for index in range(0, 5):
+            Group.objects.create(name=f"GROUP_{index}").permissions.add(
+                *Permission.objects.all()[:50]
+            )
+        self.assertEqual(self.render_changelist_columns(Group, ["codenames"]), num_queries)
+
+    def test_group_admin_codenames_truncated(self):
+        model_admin = edc_auth_admin._registry[Group]
+        group = Group.objects.create(name="GROUP")
+        group.permissions.add(*Permission.objects.all()[: model_admin.max_codenames])
+        self.assertNotIn("<details>", model_admin.codenames(group))
+        group.permissions.add(*Permission.objects.all()[: model_admin.max_codenames + 3])
+        self.assertIn("<summary>3 more</summary>", model_admin.codenames(group))
+
+    def test_role_admin_columns(self):
+        num_queries = self.render_changelist_columns(Role, ["group_list"])
+        for index in range(0, 5):
+            Role.objects.create(name=f"role_{index}", display_name=f"Role {index}").groups.add(
+                *Group.objects.all()
+            )
+        self.assertEqual(self.render_changelist_columns(Role, ["group_list"]), num_queries)
+
+    def test_user_profile_admin_columns(self):
+        columns = ["user_sites", "user_email_notifications", "user_sms_notifications"]
+        create_users(count=3)
+        num_queries = self.render_changelist_columns(UserProfile, columns)
+        create_users(count=10)
+        for user_profile in UserProfile.objects.all():
+            user_profile.sites.add(*Site.objects.all())
+        self.assertEqual(self.render_changelist_columns(UserProfile, columns), num_queries)
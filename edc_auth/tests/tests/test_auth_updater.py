@@ -1,10 +1,16 @@
 from copy import copy, deepcopy
 from importlib import import_module
+from pathlib import Path
+from tempfile import TemporaryDirectory
 from typing import List
+from unittest.mock import patch
 
 from django.contrib.auth.models import Group, Permission
+from django.contrib.contenttypes.models import ContentType
 from django.core.exceptions import ObjectDoesNotExist
+from django.db import connection
 from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from edc_randomization.auth_objects import (
     RANDO_BLINDED,
     RANDO_UNBLINDED,
@@ -13,13 +19,28 @@ from edc_randomization.auth_objects import (
 from edc_randomization.randomizer import Randomizer
 from edc_randomization.site_randomizers import site_randomizers
 
+from edc_auth.auth_objects import PII
+from edc_auth.auth_plan import AuthPlanError, get_dotted_path, write_auth_plan
 from edc_auth.auth_updater import AuthUpdater
+from edc_auth.auth_updater.group_updater import CodenameDoesNotExist
+from edc_auth.auth_updater.role_updater import RoleUpdater, RoleUpdaterError
+from edc_auth.fix_export_permissions import ExportPermissionsFixer
+from edc_auth.models import Role
+from edc_auth.permissions_cache import get_permissions_version
 from edc_auth.site_auths import site_auths
 
 from ...auth_objects import default_groups
 from ..randomizers import CustomRandomizer
 
 
+def pre_update_func(auth_updater):
+    pass
+
+
+def post_update_func(auth_updater, app_label):
+    pass
+
+
 @override_settings(
     EDC_AUTH_SKIP_SITE_AUTHS=True,
     EDC_AUTH_SKIP_AUTH_UPDATER=False,
@@ -41,6 +62,369 @@ class TestAuthUpdater2(TestCase):
             [c.split(".")[1] for c in codenames],
         )
 
+    def test_update_group_only_writes_changes(self):
+        codenames = [
+            "edc_auth.add_testmodel",
+            "edc_auth.change_testmodel",
+            "edc_auth.delete_testmodel",
+            "edc_auth.view_testmodel",
+        ]
+        site_auths.clear()
+        site_auths.add_group(*codenames, name="GROUP")
+        auth_updater = AuthUpdater(verbose=False)
+        self.assertEqual(auth_updater.group_updater.permission_changes["GROUP"], (4, 0))
+
+        with CaptureQueriesContext(connection) as ctx:
+            auth_updater = AuthUpdater(verbose=False, force=True)
+        self.assertEqual(auth_updater.group_updater.permission_changes["GROUP"], (0, 0))
+        self.assertFalse(
+            [
+                q["sql"]
+                for q in ctx.captured_queries
+                if "auth_group_permissions" in q["sql"]
+                and q["sql"].startswith(("INSERT", "DELETE"))
+            ]
+        )
+
+        site_auths.clear()
+        site_auths.add_group(*codenames[2:], name="GROUP")
+        auth_updater = AuthUpdater(verbose=False)
+        self.assertEqual(auth_updater.group_updater.permission_changes["GROUP"], (0, 2))
+        group = Group.objects.get(name="GROUP")
+        self.assertEqual(
+            [
+                p.codename
+                for p in group.permissions.filter(content_type__app_label="edc_auth").order_by(
+                    "codename"
+                )
+            ],
+            ["delete_testmodel", "view_testmodel"],
+        )
+
+    def test_skips_if_registry_and_permissions_unchanged(self):
+        site_auths.clear()
+        site_auths.add_group("edc_auth.view_testmodel", name="GROUP")
+        self.assertFalse(AuthUpdater(verbose=False).skipped)
+        self.assertTrue(AuthUpdater(verbose=False).skipped)
+        self.assertFalse(AuthUpdater(verbose=False, force=True).skipped)
+
+        # registry changed
+        site_auths.add_group("edc_auth.view_testmodel", name="GROUP_TWO")
+        self.assertFalse(AuthUpdater(verbose=False).skipped)
+        self.assertTrue(AuthUpdater(verbose=False).skipped)
+
+        # permissions changed
+        Permission.objects.create(
+            name="Can be tested",
+            codename="be_tested",
+            content_type=Permission.objects.get(codename="view_testmodel").content_type,
+        )
+        self.assertFalse(AuthUpdater(verbose=False).skipped)
+
+    def test_skips_with_update_funcs(self):
+        site_auths.clear()
+        site_auths.add_group("edc_auth.view_testmodel", name="GROUP")
+        site_auths.add_post_update_func("edc_auth", post_update_func)
+        self.assertFalse(AuthUpdater(verbose=False).skipped)
+        self.assertTrue(AuthUpdater(verbose=False).skipped)
+        # registry changed
+        site_auths.add_pre_update_func(pre_update_func)
+        self.assertFalse(AuthUpdater(verbose=False).skipped)
+        self.assertTrue(AuthUpdater(verbose=False).skipped)
+
+    def test_does_not_skip_if_relations_changed(self):
+        site_auths.clear()
+        site_auths.add_group("edc_auth.view_testmodel", name="GROUP")
+        site_auths.add_role("GROUP", name="ROLE")
+        self.assertFalse(AuthUpdater(verbose=False).skipped)
+        self.assertTrue(AuthUpdater(verbose=False).skipped)
+
+        # group permissions edited, e.g. in the admin
+        Group.objects.get(name="GROUP").permissions.clear()
+        self.assertFalse(AuthUpdater(verbose=False).skipped)
+        self.assertEqual(Group.objects.get(name="GROUP").permissions.count(), 1)
+        self.assertTrue(AuthUpdater(verbose=False).skipped)
+
+        # role groups edited
+        Role.objects.get(name="ROLE").groups.clear()
+        self.assertFalse(AuthUpdater(verbose=False).skipped)
+        self.assertEqual(Role.objects.get(name="ROLE").groups.count(), 1)
+
+        # group deleted
+        Group.objects.get(name="GROUP").delete()
+        self.assertFalse(AuthUpdater(verbose=False).skipped)
+        self.assertTrue(Group.objects.filter(name="GROUP").exists())
+
+    def test_removes_pii_permissions(self):
+        codenames = ["edc_auth.view_piimodel", "edc_auth.view_testmodel"]
+        site_auths.clear()
+        site_auths.add_group(*codenames, name="GROUP_ONE")
+        site_auths.add_group(*codenames, name="GROUP_TWO")
+        site_auths.add_group(*codenames, name=PII)
+        site_auths.add_pii_model("edc_auth.piimodel")
+        auth_updater = AuthUpdater(verbose=False)
+        self.assertEqual(
+            auth_updater.group_updater.permission_changes,
+            {"GROUP_ONE": (1, 0), "GROUP_TWO": (1, 0), PII: (2, 0)},
+        )
+        self.assertEqual(auth_updater.group_updater.pii_permission_changes, {})
+        for name in ["GROUP_ONE", "GROUP_TWO"]:
+            self.assertEqual(
+                [p.codename for p in Group.objects.get(name=name).permissions.all()],
+                ["view_testmodel"],
+            )
+        self.assertEqual(Group.objects.get(name=PII).permissions.count(), 2)
+
+        Group.objects.get(name="GROUP_ONE").permissions.add(
+            Permission.objects.get(codename="view_piimodel")
+        )
+        auth_updater = AuthUpdater(verbose=False, force=True)
+        self.assertEqual(auth_updater.group_updater.permission_changes["GROUP_ONE"], (0, 1))
+        self.assertEqual(
+            [p.codename for p in Group.objects.get(name="GROUP_ONE").permissions.all()],
+            ["view_testmodel"],
+        )
+
+    def test_second_run_does_not_write_group_permissions(self):
+        codenames = ["edc_auth.view_piimodel", "edc_auth.view_testmodel"]
+        site_auths.clear()
+        site_auths.add_group(*codenames, name="GROUP_ONE")
+        site_auths.add_group(*codenames, name=PII)
+        site_auths.add_pii_model("edc_auth.piimodel")
+        AuthUpdater(verbose=False)
+        table = Group.permissions.through._meta.db_table
+        with CaptureQueriesContext(connection) as ctx:
+            auth_updater = AuthUpdater(verbose=False, force=True)
+        self.assertEqual(
+            [
+                query["sql"]
+                for query in ctx.captured_queries
+                if table in query["sql"] and query["sql"].startswith(("INSERT", "DELETE"))
+            ],
+            [],
+        )
+        self.assertEqual(
+            auth_updater.group_updater.permission_changes, {"GROUP_ONE": (0, 0), PII: (0, 0)}
+        )
+
+    def test_view_only_prefix(self):
+        site_auths.clear()
+        site_auths.add_group(
+            "edc_auth.add_testmodel", "edc_auth.view_testmodel", name="GROUP_ONE"
+        )
+        site_auths.add_view_only_prefix("testmodel")
+        auth_updater = AuthUpdater(verbose=False)
+        self.assertIn("testmodel", auth_updater.group_updater.view_only_prefixes)
+        self.assertEqual(
+            [p.codename for p in Group.objects.get(name="GROUP_ONE").permissions.all()],
+            ["view_testmodel"],
+        )
+
+        # added outside of the update
+        group = Group.objects.get(name="GROUP_ONE")
+        group.permissions.add(Permission.objects.get(codename="add_testmodel"))
+        self.assertEqual(
+            auth_updater.group_updater.remove_view_only_restricted_permissions(), 1
+        )
+
+    def test_update_roles(self):
+        site_auths.clear()
+        site_auths.add_group("edc_auth.view_testmodel", name="GROUP_ONE")
+        site_auths.add_group("edc_auth.add_testmodel", name="GROUP_TWO")
+        site_auths.add_role("GROUP_ONE", "GROUP_TWO", name="ROLE_ONE")
+        site_auths.add_role("GROUP_ONE", name="ROLE_TWO")
+        auth_updater = AuthUpdater(verbose=False)
+        self.assertEqual(auth_updater.roles, {"ROLE_ONE": (2, 0), "ROLE_TWO": (1, 0)})
+        role = Role.objects.get(name="ROLE_TWO")
+        self.assertEqual(role.display_name, "Role Two")
+        self.assertEqual(role.display_index, 1)
+
+        site_auths.roles.update({"ROLE_TWO": ["GROUP_TWO"]})
+        auth_updater = AuthUpdater(verbose=False)
+        self.assertEqual(auth_updater.roles, {"ROLE_ONE": (0, 0), "ROLE_TWO": (1, 1)})
+        self.assertEqual([grp.name for grp in role.groups.all()], ["GROUP_TWO"])
+
+    def test_update_roles_sets_modified(self):
+        site_auths.clear()
+        site_auths.add_group("edc_auth.view_testmodel", name="GROUP_ONE")
+        site_auths.add_role("GROUP_ONE", name="ROLE_ONE")
+        site_auths.add_role("GROUP_ONE", name="ROLE_TWO")
+        AuthUpdater(verbose=False)
+        role = Role.objects.get(name="ROLE_TWO")
+        Role.objects.filter(id=role.id).update(display_index=5, hostname_modified="")
+        version = get_permissions_version()
+        AuthUpdater(verbose=False, force=True)
+        obj = Role.objects.get(name="ROLE_TWO")
+        self.assertEqual(obj.display_index, 1)
+        self.assertGreater(obj.modified, role.modified)
+        self.assertTrue(obj.hostname_modified)
+        self.assertGreater(get_permissions_version(), version)
+
+    def test_update_roles_bumps_version_only_if_changed(self):
+        site_auths.clear()
+        site_auths.add_group("edc_auth.view_testmodel", name="GROUP_ONE")
+        site_auths.add_role("GROUP_ONE", name="ROLE_ONE")
+        AuthUpdater(verbose=False)
+        roles = {"ROLE_ONE": ["GROUP_ONE"], "ROLE_TWO": ["GROUP_ONE"]}
+        with patch("getpass.getuser", side_effect=KeyError):
+            RoleUpdater(roles=roles).update_roles()
+        self.assertEqual(Role.objects.get(name="ROLE_ONE").display_index, 0)
+        version = get_permissions_version()
+        role_updater = RoleUpdater(roles=roles)
+        self.assertEqual(
+            role_updater.update_roles(), {"ROLE_ONE": (0, 0), "ROLE_TWO": (0, 0)}
+        )
+        self.assertEqual(role_updater.role_changes, 0)
+        self.assertEqual(get_permissions_version(), version)
+
+    def test_update_roles_reports_all_invalid_groups(self):
+        site_auths.clear()
+        site_auths.add_group("edc_auth.view_testmodel", name="GROUP_ONE")
+        site_auths.add_role("GROUP_ONE", "BLAH_ONE", name="ROLE_ONE")
+        site_auths.add_role("BLAH_TWO", name="ROLE_TWO")
+        with self.assertRaises(RoleUpdaterError) as cm:
+            AuthUpdater(verbose=False)
+        self.assertIn("BLAH_ONE", str(cm.exception))
+        self.assertIn("BLAH_TWO", str(cm.exception))
+        self.assertFalse(Role.objects.filter(name__in=["ROLE_ONE", "ROLE_TWO"]).exists())
+
+    def test_custom_permissions_tuples(self):
+        site_auths.clear()
+        site_auths.add_custom_permissions_tuples(
+            model="edc_auth.testmodel",
+            codename_tuples=(
+                ("edc_auth.special_one", "Can one"),
+                ("edc_auth.special_two", "Can two"),
+            ),
+        )
+        site_auths.add_custom_permissions_tuples(
+            model="edc_auth.piimodel",
+            codename_tuples=(("edc_auth.special_three", "Can three"),),
+        )
+        site_auths.add_group("edc_auth.special_one", "edc_auth.special_three", name="GROUP")
+        AuthUpdater(verbose=False)
+        self.assertEqual(
+            sorted([p.codename for p in Group.objects.get(name="GROUP").permissions.all()]),
+            ["special_one", "special_three"],
+        )
+        self.assertEqual(Permission.objects.get(codename="special_two").name, "Can two")
+
+        site_auths.custom_permissions_tuples["edc_auth.testmodel"] = [
+            ("edc_auth.special_one", "Can one"),
+            ("edc_auth.special_two", "Can two!"),
+        ]
+        auth_updater = AuthUpdater(verbose=False)
+        self.assertEqual(
+            auth_updater.group_updater.create_custom_permissions_from_tuples(), (0, 0)
+        )
+        self.assertEqual(Permission.objects.get(codename="special_two").name, "Can two!")
+
+    def test_update_from_plan(self):
+        site_auths.clear()
+        site_auths.add_custom_permissions_tuples(
+            model="edc_auth.testmodel", codename_tuples=(("edc_auth.special_one", "Can one"),)
+        )
+        site_auths.add_group(
+            lambda: ["edc_auth.view_testmodel"], "edc_auth.special_one", name="GROUP_ONE"
+        )
+        site_auths.add_role("GROUP_ONE", name="ROLE_ONE")
+        with TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir) / "auth_plan.json"
+            plan = write_auth_plan(path)
+            site_auths.clear()
+            auth_updater = AuthUpdater(verbose=False, plan=str(path))
+        self.assertEqual(auth_updater.registry_fingerprint, plan["hash"])
+        self.assertEqual(
+            sorted(
+                [p.codename for p in Group.objects.get(name="GROUP_ONE").permissions.all()]
+            ),
+            ["special_one", "view_testmodel"],
+        )
+        self.assertEqual(
+            [grp.name for grp in Role.objects.get(name="ROLE_ONE").groups.all()], ["GROUP_ONE"]
+        )
+        self.assertRaises(
+            AuthPlanError, AuthUpdater, verbose=False, plan={**plan, "edc_auth_version": "-"}
+        )
+        plan["registry"]["groups"]["GROUP_ONE"].append("edc_auth.add_testmodel")
+        self.assertRaises(AuthPlanError, AuthUpdater, verbose=False, plan=plan)
+
+    def test_plan_refuses_update_funcs_in_auths_module(self):
+        self.assertEqual(
+            get_dotted_path(post_update_func),
+            "edc_auth.tests.tests.test_auth_updater.post_update_func",
+        )
+        self.assertRaises(AuthPlanError, get_dotted_path, "edc_auth.auths.update_func")
+
+    def test_dry_run_reports_delta_without_writing(self):
+        site_auths.clear()
+        site_auths.add_custom_permissions_tuples(
+            model="edc_auth.testmodel", codename_tuples=(("edc_auth.special_one", "Can one"),)
+        )
+        site_auths.add_group(
+            "edc_auth.view_testmodel", "edc_auth.special_one", name="GROUP_ONE"
+        )
+        site_auths.add_role("GROUP_ONE", name="ROLE_ONE")
+        Group.objects.create(name="OLD_GROUP")
+        with CaptureQueriesContext(connection) as ctx:
+            delta = AuthUpdater(verbose=False, dry_run=True).delta
+        self.assertLess(len(ctx.captured_queries), 20)
+        self.assertEqual(delta["permissions"], {"create": 1, "update": 0})
+        self.assertEqual(delta["groups"]["create"], ["GROUP_ONE"])
+        self.assertIn("OLD_GROUP", delta["groups"]["delete"])
+        self.assertEqual(delta["group_permissions"], {"GROUP_ONE": (2, 0)})
+        self.assertIn("ROLE_ONE", delta["roles"]["create"])
+        self.assertEqual(delta["role_groups"], {"ROLE_ONE": (1, 0)})
+        self.assertGreater(delta["estimated_writes"], 0)
+        self.assertFalse(Group.objects.filter(name="GROUP_ONE").exists())
+        self.assertFalse(Permission.objects.filter(codename="special_one").exists())
+        self.assertTrue(Group.objects.filter(name="OLD_GROUP").exists())
+
+        AuthUpdater(verbose=False)
+        delta = AuthUpdater(verbose=False, dry_run=True).delta
+        self.assertEqual(delta["group_permissions"], {})
+        self.assertEqual(delta["role_groups"], {})
+        self.assertEqual(delta["missing_codenames"], [])
+        self.assertEqual(delta["estimated_writes"], 0)
+
+    def test_dry_run_does_not_create_content_types(self):
+        site_auths.clear()
+        site_auths.add_custom_permissions_tuples(
+            model="edc_auth.testmodel", codename_tuples=(("edc_auth.special_one", "Can one"),)
+        )
+        site_auths.add_group("edc_auth.special_one", name="GROUP_ONE")
+        site_auths.add_pii_model("edc_auth.testmodel")
+        ContentType.objects.filter(app_label="edc_auth", model="testmodel").delete()
+        ContentType.objects.clear_cache()
+        delta = AuthUpdater(verbose=False, dry_run=True).delta
+        self.assertEqual(delta["content_types"], {"create": 1})
+        self.assertEqual(delta["permissions"], {"create": 1, "update": 0})
+        self.assertFalse(
+            ContentType.objects.filter(app_label="edc_auth", model="testmodel").exists()
+        )
+
+    def test_fix_export_permissions(self):
+        Permission.objects.filter(codename="export_testmodel").delete()
+        Permission.objects.filter(codename="import_testmodel").update(name="blah")
+        fixer = ExportPermissionsFixer(app_label="edc_auth", dry_run=True)
+        self.assertEqual(fixer.fix(), (1, 1))
+        self.assertFalse(Permission.objects.filter(codename="export_testmodel").exists())
+        fixer = ExportPermissionsFixer(app_label="edc_auth")
+        self.assertEqual(fixer.fix(), (1, 1))
+        self.assertEqual(
+            Permission.objects.get(codename="import_testmodel").name, "Can import test model"
+        )
+        self.assertEqual(fixer.fix(), (0, 0))
+
+    @override_settings(EDC_AUTH_CODENAMES_WARN_ONLY=False)
+    def test_missing_codename_raises(self):
+        site_auths.clear()
+        site_auths.add_group("edc_auth.view_testmodel", name="GROUP_ONE")
+        site_auths.add_group(
+            "edc_auth.view_testmodel", "edc_auth.view_blahblah", name="GROUP_TWO"
+        )
+        self.assertRaises(CodenameDoesNotExist, AuthUpdater, verbose=False)
+
     def test_add_group_with_callable(self):
         def codenames_callable() -> List[str]:
             return [
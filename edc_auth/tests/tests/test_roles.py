@@ -1,8 +1,13 @@
+from unittest.mock import PropertyMock, patch
+
 from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
 from django.core.exceptions import ObjectDoesNotExist
+from django.db import connection
 from django.test import override_settings
 from faker import Faker
 
+from edc_auth.auth_closure import AuthClosure, auth_closure
 from edc_auth.auth_updater import AuthUpdater
 from edc_auth.constants import (
     ACCOUNT_MANAGER_ROLE,
@@ -14,8 +19,10 @@ from edc_auth.constants import (
     STAFF_ROLE,
     STATISTICIAN,
 )
+from edc_auth.deferred_role_updates import defer_role_group_updates
 from edc_auth.models import Role
 from edc_auth.site_auths import site_auths
+from edc_auth.utils import get_codenames_for_role
 
 from ..utils import EdcAuthTestCase, create_users
 
@@ -87,3 +94,182 @@ class TestRoles(EdcAuthTestCase):
         # should trigger post remove m2m signal
         user.userprofile.roles.remove(clinician_super_role)
         self.assertEqual(user.groups.all().count(), len(clinician_groups))
+
+    def test_refresh_groups_in_roles_per_user(self):
+        AuthUpdater(verbose=False)
+        create_users(count=3)
+        user, custom_user, no_role_user = user_model.objects.all().order_by("username")
+        clinician_groups = site_auths.roles.get(CLINICIAN_ROLE)
+        user.userprofile.roles.add(Role.objects.get(name=CLINICIAN_ROLE))
+        custom_user.userprofile.roles.add(Role.objects.get(name=CUSTOM_ROLE))
+        extra_group = Group.objects.exclude(name__in=clinician_groups).first()
+        for obj in [user, custom_user, no_role_user]:
+            obj.groups.add(extra_group)
+        user.groups.remove(Group.objects.get(name=clinician_groups[0]))
+
+        changes = AuthUpdater.refresh_groups_in_roles_per_user()
+
+        self.assertEqual(changes[user.id], (1, 1))
+        self.assertEqual(changes[no_role_user.id], (0, 1))
+        self.assertNotIn(custom_user.id, changes)
+        self.assertEqual(
+            sorted([grp.name for grp in user.groups.all()]), sorted(clinician_groups)
+        )
+        self.assertEqual(no_role_user.groups.all().count(), 0)
+        self.assertEqual([grp.name for grp in custom_user.groups.all()], [extra_group.name])
+        self.assertEqual(AuthUpdater.refresh_groups_in_roles_per_user(), {})
+
+    def test_defer_role_group_updates(self):
+        AuthUpdater(verbose=False)
+        create_users(count=2)
+        user, other_user = user_model.objects.all().order_by("username")
+        clinician_role = Role.objects.get(name=CLINICIAN_ROLE)
+        clinician_super_role = Role.objects.get(name=CLINICIAN_SUPER_ROLE)
+        clinician_groups = site_auths.roles.get(CLINICIAN_ROLE)
+        clinician_super_groups = site_auths.roles.get(CLINICIAN_SUPER_ROLE)
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with defer_role_group_updates():
+                for obj in [user, other_user]:
+                    obj.userprofile.roles.add(clinician_role, clinician_super_role)
+                user.userprofile.roles.remove(clinician_super_role)
+                self.assertEqual(user.groups.all().count(), 0)
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(
+            sorted([grp.name for grp in user.groups.all()]), sorted(clinician_groups)
+        )
+        self.assertEqual(
+            sorted([grp.name for grp in other_user.groups.all()]),
+            sorted(set(clinician_groups + clinician_super_groups)),
+        )
+
+    def test_defer_role_group_updates_reconciles_on_error(self):
+        AuthUpdater(verbose=False)
+        create_users(count=1)
+        user = user_model.objects.all()[0]
+        clinician_role = Role.objects.get(name=CLINICIAN_ROLE)
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with self.assertRaises(ValueError):
+                with defer_role_group_updates():
+                    user.userprofile.roles.add(clinician_role)
+                    raise ValueError("import failed")
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(
+            sorted([grp.name for grp in user.groups.all()]),
+            sorted(site_auths.roles.get(CLINICIAN_ROLE)),
+        )
+
+    def test_defer_role_group_updates_keeps_original_error(self):
+        AuthUpdater(verbose=False)
+        create_users(count=1)
+        user = user_model.objects.all()[0]
+        clinician_role = Role.objects.get(name=CLINICIAN_ROLE)
+        # as in autocommit mode, outside of the test case transaction
+        autocommit = patch.object(connection, "in_atomic_block", False)
+        with (
+            patch(
+                "edc_auth.deferred_role_updates.DeferredRoleUpdates.reconcile",
+                side_effect=RuntimeError("reconcile failed"),
+            ) as reconcile,
+            self.assertLogs("edc_auth.deferred_role_updates", level="ERROR"),
+            self.assertRaisesMessage(ValueError, "import failed"),
+        ):
+            try:
+                with defer_role_group_updates():
+                    user.userprofile.roles.add(clinician_role)
+                    autocommit.start()
+                    raise ValueError("import failed")
+            finally:
+                autocommit.stop()
+        reconcile.assert_called_once()
+
+    def test_defer_role_group_updates_custom_role(self):
+        AuthUpdater(verbose=False)
+        create_users(count=1)
+        user = user_model.objects.all()[0]
+        custom_role = Role.objects.get(name=CUSTOM_ROLE)
+        user.userprofile.roles.add(custom_role)
+        user.groups.add(Group.objects.get(name=site_auths.roles.get(CLINICIAN_ROLE)[0]))
+        with self.captureOnCommitCallbacks(execute=True):
+            with defer_role_group_updates():
+                user.userprofile.roles.remove(custom_role)
+        self.assertEqual([role.name for role in user.userprofile.roles.all()], [STAFF_ROLE])
+        self.assertEqual(
+            sorted([grp.name for grp in user.groups.all()]),
+            sorted(site_auths.roles.get(STAFF_ROLE)),
+        )
+
+    def test_defer_role_group_updates_swap_custom_role(self):
+        AuthUpdater(verbose=False)
+        create_users(count=2)
+        user, other_user = user_model.objects.all().order_by("username")
+        custom_role = Role.objects.get(name=CUSTOM_ROLE)
+        clinician_role = Role.objects.get(name=CLINICIAN_ROLE)
+        for obj in [user, other_user]:
+            obj.userprofile.roles.add(custom_role)
+        with self.captureOnCommitCallbacks(execute=True):
+            with defer_role_group_updates():
+                # as in `save_related`, removes then adds
+                user.userprofile.roles.set([clinician_role])
+                other_user.userprofile.roles.remove(custom_role)
+                other_user.userprofile.roles.add(custom_role)
+        self.assertEqual(
+            sorted([role.name for role in user.userprofile.roles.all()]),
+            sorted([CLINICIAN_ROLE, STAFF_ROLE]),
+        )
+        self.assertEqual(
+            sorted([grp.name for grp in user.groups.all()]),
+            sorted(
+                set(site_auths.roles.get(CLINICIAN_ROLE) + site_auths.roles.get(STAFF_ROLE))
+            ),
+        )
+        self.assertEqual(
+            [role.name for role in other_user.userprofile.roles.all()], [CUSTOM_ROLE]
+        )
+
+    def test_role_groups_read_from_database(self):
+        AuthUpdater(verbose=False)
+        create_users(count=1)
+        user = user_model.objects.all()[0]
+        role = Role.objects.get(name=CLINICIAN_ROLE)
+        auth_closure.get_group_ids_for_role(CLINICIAN_ROLE)
+        group = role.groups.all()[0]
+        group.delete()
+        with patch.object(AuthClosure, "data", new_callable=PropertyMock) as data:
+            user.userprofile.roles.add(role)
+            user.userprofile.roles.remove(role)
+            user.userprofile.roles.add(role)
+        data.assert_not_called()
+        self.assertEqual(
+            sorted([grp.name for grp in user.groups.all()]),
+            sorted(set(site_auths.roles.get(CLINICIAN_ROLE)) - {group.name}),
+        )
+
+    def test_auth_closure_ttl(self):
+        AuthUpdater(verbose=False)
+        auth_closure.get_group_ids_for_role(CLINICIAN_ROLE)
+        with override_settings(EDC_AUTH_CLOSURE_TTL=0):
+            # reload
+            with self.assertNumQueries(2):
+                auth_closure.get_group_ids_for_role(CLINICIAN_ROLE)
+
+    def test_auth_closure(self):
+        AuthUpdater(verbose=False)
+        role = Role.objects.get(name=CLINICIAN_ROLE)
+        group_ids = {grp.id for grp in role.groups.all()}
+        self.assertEqual(auth_closure.get_group_ids_for_role(CLINICIAN_ROLE), group_ids)
+        # version counter is in the cache
+        with self.assertNumQueries(0):
+            auth_closure.get_group_ids_for_role(CLINICIAN_ROLE)
+        self.assertEqual(
+            set(get_codenames_for_role(CLINICIAN_ROLE)),
+            {
+                f"{p.content_type.app_label}.{p.codename}"
+                for grp in role.groups.all()
+                for p in grp.permissions.all()
+            },
+        )
+
+        # invalidated by m2m signal
+        group = Group.objects.exclude(id__in=group_ids).first()
+        role.groups.add(group)
+        self.assertIn(group.id, auth_closure.get_group_ids_for_role(CLINICIAN_ROLE))
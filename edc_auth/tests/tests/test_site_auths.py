@@ -0,0 +1,248 @@
+from copy import deepcopy
+
+from django.test import TestCase, override_settings
+
+from edc_auth.site_auths import (
+    InvalidGroup,
+    SiteAuths,
+    convert_view_to_export_wrapper,
+    expand_groups,
+    get_model_labels,
+    parse_codename,
+    remove_delete_wrapper,
+)
+
+
+class TestSiteAuths(TestCase):
+    def test_parse_codename(self):
+        parsed = parse_codename("edc_auth.view_historicaluserprofile")
+        self.assertEqual(parsed.app_label, "edc_auth")
+        self.assertEqual(parsed.action, "view")
+        self.assertEqual(parsed.model, "historicaluserprofile")
+        self.assertTrue(parsed.is_historical)
+        self.assertTrue(parsed.is_view)
+        self.assertTrue(parse_codename("edc_navbar.nav_screening").is_view)
+        self.assertFalse(parse_codename("edc_auth.add_role").is_view)
+        self.assertIs(parse_codename("edc_auth.add_role"), parse_codename("edc_auth.add_role"))
+
+    def test_convert_view_to_export(self):
+        self.assertEqual(
+            convert_view_to_export_wrapper(
+                [
+                    "edc_auth.view_role",
+                    "edc_auth.add_role",
+                    "edc_auth.view_historicaluserprofile",
+                    "edc_auth.view_doesnotexist",
+                    lambda: ["sites.view_site"],
+                ]
+            ),
+            ["edc_auth.export_role", "sites.export_site"],
+        )
+
+    def test_view_only_and_no_delete(self):
+        codenames = [
+            "edc_auth.add_role",
+            "edc_auth.delete_role",
+            "edc_auth.view_role",
+            "edc_dashboard.view_subject_listboard",
+        ]
+        self.assertEqual(
+            SiteAuths.get_view_only_codenames(codenames),
+            ["edc_auth.view_role", "edc_dashboard.view_subject_listboard"],
+        )
+        self.assertEqual(
+            remove_delete_wrapper(codenames),
+            [
+                "edc_auth.add_role",
+                "edc_auth.view_role",
+                "edc_dashboard.view_subject_listboard",
+            ],
+        )
+
+    def test_expand_groups_calls_each_callable_once(self):
+        calls = []
+
+        def get_codenames():
+            calls.append(1)
+            return ["edc_auth.view_role", "edc_auth.delete_role", "edc_auth.add_role"]
+
+        site_auths = SiteAuths()
+        site_auths.clear()
+        site_auths.add_group(get_codenames, name="A")
+        site_auths.add_group(get_codenames, name="B", view_only=True)
+        site_auths.add_group(get_codenames, name="C", no_delete=True)
+        site_auths.add_group(get_codenames, "edc_auth.add_role", name="D")
+        self.assertEqual(
+            expand_groups(site_auths.groups),
+            {
+                "A": ("edc_auth.add_role", "edc_auth.delete_role", "edc_auth.view_role"),
+                "B": ("edc_auth.view_role",),
+                "C": ("edc_auth.add_role", "edc_auth.view_role"),
+                "D": ("edc_auth.add_role", "edc_auth.delete_role", "edc_auth.view_role"),
+            },
+        )
+        self.assertEqual(len(calls), 1)
+
+    def test_journaled_rolls_back_only_changes_in_block(self):
+        site_auths = SiteAuths()
+        site_auths.clear()
+        site_auths.add_group("edc_auth.view_role", name="A")
+        site_auths.add_role("A", name="ROLE_A")
+        site_auths.add_custom_permissions_tuples("edc_auth.role", (("edc_auth.a", "A"),))
+        registry = deepcopy(site_auths.registry)
+        with self.assertRaises(ImportError):
+            with site_auths.journaled():
+                site_auths.add_group("edc_auth.view_role", name="B")
+                site_auths.update_group("edc_auth.add_role", name="A")
+                site_auths.update_role("B", name="ROLE_A")
+                site_auths.add_pii_model("edc_auth.userprofile")
+                site_auths.add_view_only_prefix("edc_auth.view_historical")
+                site_auths.add_custom_permissions_tuples(
+                    "edc_auth.role", (("edc_auth.b", "B"),)
+                )
+                site_auths.add_custom_permissions_tuples(
+                    "edc_auth.userprofile", (("edc_auth.c", "C"),)
+                )
+                raise ImportError("bad auths module")
+        self.assertEqual(site_auths.registry, registry)
+        self.assertIsNone(site_auths.journal)
+        with site_auths.journaled():
+            site_auths.add_group("edc_auth.view_role", name="B")
+        self.assertIn("B", site_auths.groups)
+
+    def test_update_groups_and_roles_merged_on_read(self):
+        site_auths = SiteAuths()
+        site_auths.clear()
+        site_auths.add_group("edc_auth.view_role", "edc_auth.add_role", name="A")
+        site_auths.add_role("A", name="ROLE_A")
+        site_auths.update_group("edc_auth.change_role", "edc_auth.view_role", name="A")
+        site_auths.update_group("edc_auth.delete_role", name="A")
+        site_auths.update_role("B", "A", name="ROLE_A")
+        self.assertTrue(site_auths.dirty)
+        self.assertEqual(
+            site_auths.groups["A"],
+            [
+                "edc_auth.view_role",
+                "edc_auth.add_role",
+                "edc_auth.change_role",
+                "edc_auth.delete_role",
+            ],
+        )
+        self.assertEqual(site_auths.roles["ROLE_A"], ["A", "B"])
+        self.assertFalse(site_auths.dirty)
+        site_auths.groups["A"] = ["edc_auth.view_role"]
+        site_auths.verify_and_populate()
+        self.assertEqual(site_auths.groups["A"], ["edc_auth.view_role"])
+
+    def test_update_unknown_group_raises_on_verify(self):
+        site_auths = SiteAuths()
+        site_auths.clear()
+        site_auths.update_group("edc_auth.view_role", name="A")
+        self.assertEqual(site_auths.groups, {})
+        with self.assertRaises(InvalidGroup):
+            site_auths.verify_and_populate()
+        with self.assertWarns(UserWarning):
+            site_auths.verify_and_populate(warn_only=True)
+        self.assertEqual(site_auths.groups, {"A": ["edc_auth.view_role"]})
+
+    def test_update_group_before_add_group(self):
+        site_auths = SiteAuths()
+        site_auths.clear()
+        site_auths.update_group("edc_auth.change_role", name="A")
+        self.assertEqual(site_auths.groups, {})
+        site_auths.add_group("edc_auth.view_role", name="A")
+        self.assertEqual(
+            site_auths.groups["A"], ["edc_auth.view_role", "edc_auth.change_role"]
+        )
+        site_auths.verify_and_populate()
+
+    def test_model_labels_cleared(self):
+        self.assertIn("edc_auth.role", get_model_labels())
+        self.assertEqual(get_model_labels.cache_info().currsize, 1)
+        SiteAuths().clear()
+        self.assertEqual(get_model_labels.cache_info().currsize, 0)
+        get_model_labels()
+        with override_settings(INSTALLED_APPS=["django.contrib.contenttypes"]):
+            self.assertEqual(get_model_labels.cache_info().currsize, 0)
+            self.assertNotIn("edc_auth.role", get_model_labels())
+        self.assertIn("edc_auth.role", get_model_labels())
+
+    def test_snapshot_and_diff(self):
+        site_auths = SiteAuths()
+        site_auths.clear()
+        site_auths.add_group("edc_auth.view_role", "edc_auth.add_role", name="A")
+        site_auths.add_group(lambda: ["edc_auth.view_role"], name="B")
+        site_auths.add_role("A", "B", name="ROLE_A")
+        snapshot = site_auths.snapshot()
+        self.assertEqual(
+            snapshot.groups,
+            (
+                ("A", ("edc_auth.add_role", "edc_auth.view_role")),
+                ("B", ("edc_auth.view_role",)),
+            ),
+        )
+        self.assertEqual(hash(snapshot), hash(site_auths.snapshot()))
+        self.assertEqual(snapshot.hash, site_auths.snapshot().hash)
+        self.assertEqual(SiteAuths.diff(snapshot, site_auths.snapshot()), {})
+        self.assertNotEqual(snapshot.hash, site_auths.snapshot(version="1").hash)
+
+        site_auths.update_group("edc_auth.change_role", name="A")
+        site_auths.add_group("edc_auth.view_role", name="C")
+        site_auths.add_role("C", name="ROLE_C")
+        site_auths.registry["roles"]["ROLE_A"] = ["A"]
+        site_auths.registry["groups"].pop("B")
+        self.assertEqual(
+            SiteAuths.diff(snapshot, site_auths.snapshot()),
+            {
+                "groups": (("C",), ("B",)),
+                "roles": (("ROLE_C",), ()),
+                "codenames": {
+                    "A": (("edc_auth.change_role",), ()),
+                    "B": ((), ("edc_auth.view_role",)),
+                    "C": (("edc_auth.view_role",), ()),
+                },
+                "role_groups": {"ROLE_A": ((), ("B",)), "ROLE_C": (("C",), ())},
+            },
+        )
+
+    def test_snapshot_includes_update_funcs(self):
+        site_auths = SiteAuths()
+        site_auths.clear()
+        snapshot = site_auths.snapshot()
+        site_auths.add_post_update_func("edc_auth", expand_groups)
+        self.assertEqual(
+            site_auths.snapshot().post_update_funcs,
+            (("edc_auth", "edc_auth.site_auths.expand_groups"),),
+        )
+        self.assertEqual(
+            SiteAuths.diff(snapshot, site_auths.snapshot()),
+            {"post_update_funcs": ((("edc_auth", "edc_auth.site_auths.expand_groups"),), ())},
+        )
+
+    def test_diff_custom_permissions_and_view_only_prefixes(self):
+        site_auths = SiteAuths()
+        site_auths.clear()
+        site_auths.add_custom_permissions_tuples(
+            "edc_auth.role", (("edc_auth.special_role", "Can special role"),)
+        )
+        snapshot = site_auths.snapshot()
+        site_auths.add_custom_permissions_tuples(
+            "edc_auth.role", (("edc_auth.other_role", "Can other role"),)
+        )
+        self.assertEqual(
+            SiteAuths.diff(snapshot, site_auths.snapshot()),
+            {
+                "custom_permissions_tuples": {
+                    "edc_auth.role": (
+                        (("edc_auth.other_role", "Can other role"),),
+                        (),
+                    )
+                }
+            },
+        )
+        snapshot = site_auths.snapshot()
+        site_auths.add_view_only_prefix("edc_auth")
+        self.assertEqual(
+            SiteAuths.diff(snapshot, site_auths.snapshot(version="1")),
+            {"version": (None, "1"), "view_only_prefixes": (("edc_auth",), ())},
+        )
@@ -1,4 +1,7 @@
+import csv
+import os
 from string import Template
+from tempfile import mkdtemp
 
 from django.contrib.auth.models import User
 from django.core import mail
@@ -7,9 +10,11 @@ from edc_protocol.research_protocol_config import ResearchProtocolConfig
 from faker import Faker
 
 from edc_auth.auth_updater import AuthUpdater
-from edc_auth.constants import CLINIC, CLINICIAN_ROLE
+from edc_auth.constants import CLINIC, CLINICIAN_ROLE, STAFF_ROLE
+from edc_auth.export_users import export_users
 from edc_auth.import_users import UserImporter, UserImporterError, import_users
 from edc_auth.password_setter import PasswordSetter
+from edc_auth.site_auths import site_auths
 
 from ..utils import EdcAuthTestCase, create_user_csv_file, create_users
 
@@ -47,6 +52,59 @@ class TestUser(EdcAuthTestCase):
             "EDC: Your example.com user account is ready.",
         )
 
+    def test_import_users_bulk(self):
+        AuthUpdater(verbose=False, warn_only=True)
+        import_users(self.filename, resource_name=None, send_email_to_user=True, bulk=True)
+        self.assertEqual(User.objects.all().count(), 2)
+        self.assertEqual(len(mail.outbox), 2)
+        for user in User.objects.all():
+            self.assertEqual([obj.name for obj in user.userprofile.roles.all()], [STAFF_ROLE])
+            self.assertEqual(
+                sorted([obj.name for obj in user.groups.all()]),
+                sorted(site_auths.roles.get(STAFF_ROLE)),
+            )
+
+        # update existing users
+        import_users(self.filename, resource_name=None, send_email_to_user=True, bulk=True)
+        self.assertEqual(User.objects.all().count(), 2)
+        self.assertEqual(len(mail.outbox), 4)
+
+    def test_import_users_bulk_validates_all_rows(self):
+        AuthUpdater(verbose=False, warn_only=True)
+        filename = os.path.join(mkdtemp(), "users.csv")
+        with open(filename, "w") as f:
+            writer = csv.DictWriter(
+                f, fieldnames=["username", "site_names", "role_names"], delimiter="|"
+            )
+            writer.writeheader()
+            writer.writerow({"username": "erik", "site_names": "harare", "role_names": ""})
+            writer.writerow({"username": "noam", "site_names": "blah", "role_names": ""})
+            writer.writerow({"username": "jen", "site_names": "", "role_names": "blah"})
+        with self.assertRaises(UserImporterError) as cm:
+            import_users(filename, resource_name=None, bulk=True)
+        self.assertIn("noam, blah", str(cm.exception))
+        self.assertIn("`blah` for user `jen`", str(cm.exception))
+        self.assertEqual(User.objects.all().count(), 0)
+
+    def test_export_users(self):
+        AuthUpdater(verbose=False, warn_only=True)
+        create_users(5)
+        path = os.path.join(mkdtemp(), "users.csv")
+        stats = export_users(path, chunk_size=2)
+        self.assertEqual(stats["rows"], 5)
+        # one query for users and two prefetch queries per chunk
+        self.assertLessEqual(stats["queries"], 7)
+        with open(path) as f:
+            rows = [row for row in csv.DictReader(f, delimiter="|")]
+        self.assertEqual(
+            [row["username"] for row in rows],
+            [obj.username for obj in User.objects.all().order_by("username")],
+        )
+        self.assertEqual(
+            rows[0]["site_names"],
+            User.objects.get(username=rows[0]["username"]).userprofile.sites.all()[0].name,
+        )
+
     def test_bad_username(self):
         AuthUpdater(verbose=False, warn_only=True)
         self.assertRaises(
@@ -1,4 +1,4 @@
-from django.contrib.auth.models import User
+from django.contrib.auth.models import Group, Permission, User
 from django.contrib.sites.models import Site
 from django.test import override_settings
 from django.test.client import RequestFactory
@@ -9,6 +9,18 @@ from edc_auth.tests.utils import EdcAuthTestCase
 
 from ...backends import ModelBackendWithSite
 from ...models.role import Role
+from ...permissions_cache import (
+    get_permissions_version,
+    get_user_version_key,
+    get_versions,
+)
+from ...utils import (
+    get_allowed_site_ids,
+    get_change_codenames,
+    get_codenames_for_role,
+    get_codenames_for_user,
+    user_has_change_perms,
+)
 
 
 @override_settings(
@@ -80,3 +92,130 @@ class TestUserProfile(EdcAuthTestCase):
         user.userprofile.roles.add(role)
         user.refresh_from_db()
         self.assertGreater(user.groups.all().count(), 0)
+
+    def test_backend_caches_permissions(self):
+        AuthUpdater(verbose=False)
+        user = User.objects.create(
+            username="erik", is_superuser=False, is_active=True, is_staff=True
+        )
+        role = Role.objects.get(name=CLINICIAN_ROLE)
+        user.userprofile.roles.add(role)
+        backend = ModelBackendWithSite()
+        permissions = backend.get_all_permissions(User.objects.get(username="erik"))
+        self.assertGreater(len(permissions), 0)
+
+        user = User.objects.get(username="erik")
+        # read from the cache
+        with self.assertNumQueries(0):
+            self.assertEqual(backend.get_all_permissions(user), permissions)
+            self.assertTrue(backend.has_perm(user, list(permissions)[0]))
+
+        # removing the role invalidates the cached permissions
+        user.userprofile.roles.remove(role)
+        self.assertEqual(backend.get_all_permissions(User.objects.get(username="erik")), set())
+
+    def test_user_save_invalidates_only_for_permission_fields(self):
+        user = User.objects.create(
+            username="erik", is_superuser=False, is_active=True, is_staff=True
+        )
+        key = get_user_version_key(user.id)
+        version = get_versions(key)[key]
+        user.first_name = "Erik"
+        user.save()
+        user.save(update_fields=["last_login"])
+        self.assertEqual(get_versions(key)[key], version)
+        user.is_active = False
+        user.save(update_fields=["is_active"])
+        self.assertGreater(get_versions(key)[key], version)
+
+    def test_cached_permissions_follow_user_flags(self):
+        user = User.objects.create(
+            username="erik", is_superuser=False, is_active=True, is_staff=True
+        )
+        backend = ModelBackendWithSite()
+        self.assertEqual(backend.get_all_permissions(User.objects.get(username="erik")), set())
+        # a full save does not bump the version, the flags are part of the cache key
+        user.is_superuser = True
+        user.save()
+        self.assertGreater(
+            len(backend.get_all_permissions(User.objects.get(username="erik"))), 0
+        )
+
+    def test_deleting_group_invalidates_cached_permissions(self):
+        user = User.objects.create(
+            username="erik", is_superuser=False, is_active=True, is_staff=True
+        )
+        group = Group.objects.create(name="GROUP")
+        group.permissions.add(Permission.objects.get(codename="change_user"))
+        user.groups.add(group)
+        backend = ModelBackendWithSite()
+        self.assertEqual(
+            backend.get_all_permissions(User.objects.get(username="erik")),
+            {"auth.change_user"},
+        )
+        version = get_permissions_version()
+        group.delete()
+        self.assertGreater(get_permissions_version(), version)
+        self.assertEqual(backend.get_all_permissions(User.objects.get(username="erik")), set())
+
+    @override_settings(SITE_ID=20)
+    def test_allowed_site_ids(self):
+        ten = Site.objects.get(id=10)
+        twenty = Site.objects.get(id=20)
+        user = User.objects.create(
+            username="erik", is_superuser=False, is_active=True, is_staff=True
+        )
+        user.set_password("password")
+        user.save()
+        user.userprofile.sites.add(ten)
+        self.assertEqual(get_allowed_site_ids(user), frozenset({10}))
+        # memoized on the user object
+        with self.assertNumQueries(0):
+            self.assertEqual(get_allowed_site_ids(user), frozenset({10}))
+        # read from the cache
+        user = User.objects.get(username="erik")
+        with self.assertNumQueries(0):
+            self.assertEqual(get_allowed_site_ids(user), frozenset({10}))
+        request = RequestFactory()
+        backend = ModelBackendWithSite()
+        self.assertIsNone(
+            backend.authenticate(request, username="erik", password="password")  # nosec B106
+        )
+        # adding a site invalidates the cached site ids
+        user.userprofile.sites.add(twenty)
+        self.assertEqual(
+            get_allowed_site_ids(User.objects.get(username="erik")), frozenset({10, 20})
+        )
+        self.assertIsNotNone(
+            backend.authenticate(request, username="erik", password="password")  # nosec B106
+        )
+
+    def test_codenames_for_user(self):
+        AuthUpdater(verbose=False)
+        user = User.objects.create(username="erik", is_active=True, is_staff=True)
+        self.assertEqual(get_codenames_for_user(user=user), set())
+        self.assertFalse(user_has_change_perms(user=user))
+
+        user.userprofile.roles.add(Role.objects.get(name=CLINICIAN_ROLE))
+        codenames = get_codenames_for_user(user=user)
+        self.assertIsInstance(codenames, set)
+        self.assertEqual(codenames, get_codenames_for_role(CLINICIAN_ROLE))
+        # roles and EXISTS
+        with self.assertNumQueries(2):
+            self.assertTrue(user_has_change_perms(user=user))
+
+        user.userprofile.roles.clear()
+        user.user_permissions.add(Permission.objects.get(codename="change_user"))
+        self.assertEqual(get_codenames_for_user(user=user), {"auth.change_user"})
+        self.assertTrue(user_has_change_perms(user=user))
+        self.assertEqual(get_change_codenames(user=user), ["auth.change_user"])
+
+        # prefix, not substring
+        permission = Permission.objects.create(
+            name="Can view change log",
+            codename="view_change_log",
+            content_type=Permission.objects.get(codename="view_user").content_type,
+        )
+        user.user_permissions.set([permission])
+        self.assertFalse(user_has_change_perms(user=user))
+        self.assertEqual(get_change_codenames(user=user), [])
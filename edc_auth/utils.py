@@ -6,15 +6,18 @@ from typing import TYPE_CHECKING, Any
 from django.apps import apps as django_apps
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ObjectDoesNotExist
-from django.db.models import QuerySet
+from django.db.models import Q, QuerySet
 
+from .auth_closure import auth_closure
 from .constants import ACCOUNT_MANAGER_ROLE
 
 if TYPE_CHECKING:
-    from django.contrib.auth.models import Group, User
+    from django.contrib.auth.models import Group, Permission, User
 
     from .models import Role
 
+CHANGE_CODENAME_PREFIXES = ("add_", "change_", "delete_")
+
 
 def get_user(username: str) -> User | None:
     try:
@@ -24,6 +27,16 @@ def get_user(username: str) -> User | None:
     return user
 
 
+def get_allowed_site_ids(user: User) -> frozenset[int]:
+    """Returns the ids of the sites the user may access.
+
+    Read from the permissions cache, see `ModelBackendWithSite`.
+    """
+    from .backends import ModelBackendWithSite
+
+    return ModelBackendWithSite().get_allowed_site_ids(user)
+
+
 def compare_codenames_for_group(group_name: str = None, expected: list[str] = None) -> None:
     group = django_apps.get_model("auth.group").objects.get(name=group_name)
     codenames = [p.codename for p in group.permissions.all()]
@@ -77,63 +90,107 @@ def make_view_only_group_permissions(
         group.permissions.remove(permission)
 
 
-def get_codenames_for_role(role_name: str) -> list[str]:
-    codenames = []
-    role_cls = django_apps.get_model("edc_auth.role")
-    try:
-        roles = role_cls.objects.get(name=role_name).groups.all()
-    except ObjectDoesNotExist:
-        pass
-    else:
-        for group in roles:
-            codenames.extend(
-                [
-                    f"{permission.content_type.app_label}.{permission.codename}"
-                    for permission in group.permissions.all()
-                ]
-            )
-    return codenames
+def get_codenames_for_role(role_name: str) -> set[str]:
+    """Returns a set of codenames for the groups of the role.
+
+    Read from `auth_closure`.
+    """
+    return auth_closure.get_codenames_for_groups(
+        auth_closure.get_group_ids_for_role(role_name)
+    )
 
 
-def user_has_change_perms(**kwargs) -> list[str]:
-    codenames = get_codenames_for_user(**kwargs)
-    return [c for c in codenames if "add_" in c or "change_" in c or "delete_" in c]
+def get_change_permissions(
+    user: User = None, roles: QuerySet[Role] = None, include_groups: bool | None = None
+) -> QuerySet[Permission]:
+    """Returns a queryset of the add, change and delete permissions
+    of the user through roles, groups if `include_groups`, or the
+    user's permissions.
 
+    A permission is an add, change or delete permission if its
+    codename starts with one of CHANGE_CODENAME_PREFIXES.
+    """
+    q = Q(group__in=get_group_ids_for_user(user, roles, include_groups))
+    if user:
+        q |= Q(user=user)
+    change_q = Q()
+    for prefix in CHANGE_CODENAME_PREFIXES:
+        change_q |= Q(codename__startswith=prefix)
+    return (
+        django_apps.get_model("auth.permission").objects.filter(q).filter(change_q).distinct()
+    )
 
-def get_codenames_for_user(
+
+def user_has_change_perms(
+    user: User = None, roles: QuerySet[Role] = None, include_groups: bool | None = None
+) -> bool:
+    """Returns True if the user has any add, change or delete
+    permission, see `get_change_permissions`.
+
+    Runs a single EXISTS query.
+    """
+    return get_change_permissions(user, roles, include_groups).exists()
+
+
+def get_change_codenames(
     user: User = None, roles: QuerySet[Role] = None, include_groups: bool | None = None
 ) -> list[str]:
-    codenames: list[str] = []
-    groups: list[Group] = []
-    account_manager_groups: list[Group] = []
-    try:
-        role: Role = django_apps.get_model("edc_auth.role").objects.get(
-            name=ACCOUNT_MANAGER_ROLE
-        )
-    except ObjectDoesNotExist:
-        pass
-    else:
-        account_manager_groups: list[Group] = [grp for grp in role.groups.all()]
-    roles = roles or user.userprofile.roles
+    """Returns a sorted list of `app_label.codename` of the user's
+    add, change and delete permissions, see `get_change_permissions`.
+
+    Before 0.3.68 `user_has_change_perms` returned this list.
+    """
+    return sorted(
+        f"{app_label}.{codename}"
+        for app_label, codename in get_change_permissions(
+            user, roles, include_groups
+        ).values_list("content_type__app_label", "codename")
+    )
+
+
+def get_group_ids_for_user(
+    user: User = None, roles: QuerySet[Role] = None, include_groups: bool | None = None
+) -> set[int]:
+    """Returns a set of group ids for the user's roles, and groups if
+    `include_groups`, excluding groups of the ACCOUNT_MANAGER_ROLE.
 
-    for role in roles.all():
-        groups.extend([grp for grp in role.groups.all() if grp not in account_manager_groups])
+    Read from the database, not `auth_closure`, since used to
+    validate.
+    """
+    role_group_model_cls = django_apps.get_model("edc_auth.role").groups.through
+    account_manager_group_ids = role_group_model_cls.objects.filter(
+        role__name=ACCOUNT_MANAGER_ROLE
+    ).values("group_id")
+    roles = roles or user.userprofile.roles
+    group_ids = set(
+        role_group_model_cls.objects.filter(role__in=roles.all())
+        .exclude(group_id__in=account_manager_group_ids)
+        .values_list("group_id", flat=True)
+    )
     if include_groups:
-        for group in user.groups.all():
-            if group not in account_manager_groups:
-                groups.append(group)
-    groups = list(set(groups))
-    for group in groups:
-        codenames.extend(
-            [
-                f"{permission.content_type.app_label}.{permission.codename}"
-                for permission in group.permissions.all()
-            ]
+        group_ids.update(
+            user.groups.exclude(id__in=account_manager_group_ids).values_list("id", flat=True)
         )
-    codenames.extend(
-        [
-            f"{permission.content_type.app_label}.{permission.codename}"
-            for permission in user.user_permissions.all()
-        ]
+    return group_ids
+
+
+def get_codenames_for_user(
+    user: User = None, roles: QuerySet[Role] = None, include_groups: bool | None = None
+) -> set[str]:
+    """Returns a set of codenames for the user's roles, and groups
+    if `include_groups`, and the user's permissions.
+
+    Groups of the ACCOUNT_MANAGER_ROLE are excluded. Group to
+    permission relations are read from `auth_closure`.
+    """
+    codenames = auth_closure.get_codenames_for_groups(
+        get_group_ids_for_user(user, roles, include_groups)
     )
+    if user:
+        codenames.update(
+            f"{app_label}.{codename}"
+            for app_label, codename in user.user_permissions.values_list(
+                "content_type__app_label", "codename"
+            )
+        )
     return codenames